@@ -396,10 +396,12 @@ tk.Button(master, text='Stop Scraping', command=stop_scraping, font=("Calibri",
 
 # stop single job
 from tkinter import simpledialog
+from bin.scrapyd_client import ScrapydClient
 
 
 def kill_job(job_id=None):
-    subprocess.run(r"curl http://localhost:6800/cancel.json -d project=ARGUS -d job={}".format(job_id))
+    with ScrapydClient() as client:
+        client.cancel(job_id)
 
 # sub class for asking job id
 class StringDialog(simpledialog._QueryString):
@@ -418,6 +420,20 @@ def get_job_id():
 tk.Button(master, text='Terminate Job', command=get_job_id, font=("Calibri", 12)).grid(row=22, column=0, sticky=tk.W + tk.E)
 
 
+# resume an interrupted scraping run with the saved settings file
+def resume_scraping():
+    result = tk.messagebox.askyesno("WARNING", "Do you want to resume the last scraping run? Only websites which were not finished will be scraped again. Make sure that no scraping jobs are running.")
+    if result == True:
+        print("Starting server in separate windows...")
+        time.sleep(2)
+        os.startfile(r".\bin\start_server.bat")
+        time.sleep(2)
+        start_crawl.start_crawl(resume=True)
+        print("Web scraping resumed. Do not close server window.")
+
+tk.Button(master, text='Resume Scraping', command=resume_scraping, font=("Calibri", 12)).grid(row=23, column=0, sticky=tk.W + tk.E)
+
+
 # postprocessing
 from bin import postprocessing
 import configparser
@@ -448,8 +464,6 @@ tk.Button(master, text='Postprocessing', command=start_postprocessing, font=("Ca
 
 
 # aggregate webpage texts
-from bin import aggregator
-
 
 def start_aggregator(*args):
     filepath = filedialog.askopenfilename()
@@ -458,8 +472,11 @@ def start_aggregator(*args):
         if overwrite == False:
             return
     print("Starting to aggregate webpage texts to website level...")
-    output = aggregator.aggregate_webpages(filepath)
-    print("Aggregated webpage texts to:\n{}".format(output))
+    #use as many worker processes as cores are used for scraping; the aggregator runs in its own
+    #process because worker processes on Windows would import (and start) this GUI again
+    config = configparser.RawConfigParser()
+    config.read(r".\bin\settings.txt")
+    subprocess.run([sys.executable, "-m", "bin.aggregator", filepath, "--workers", config.get('system', 'n_cores', fallback="1")])
 
 
 
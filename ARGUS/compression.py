@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+# Compressed output files.
+#
+# The pipelines can write their csv chunks as gzip or zstd streams
+# (OUTPUT_COMPRESSION setting). Postprocessing and the aggregator read
+# chunks through open_output_file, which picks the decompressor by the file
+# extension, so compressed and uncompressed chunks are handled the same way.
+
+import gzip
+import io
+
+from ARGUS.exporters import BUFFER_SIZE
+
+#zstandard is only needed for zstd compressed output
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#file extension appended to ".csv" for each OUTPUT_COMPRESSION value
+COMPRESSION_EXTENSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+#compression levels used if OUTPUT_COMPRESSION_LEVEL is not set
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def check_compression(compression):
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError("Unknown output compression {!r}, use one of: {}".format(compression, ", ".join(COMPRESSION_EXTENSIONS)))
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("zstd output compression requires zstandard (pip install zstandard)")
+
+
+#function which opens a file for appending binary data, compressed according to compression
+#(an appended gzip member or zstd frame is read as part of the same file)
+def open_compressed(fn, compression="none", level=None):
+    check_compression(compression)
+    if level is None:
+        level = DEFAULT_LEVELS.get(compression)
+    if compression == "gzip":
+        return gzip.GzipFile(fn, mode="ab", compresslevel=level)
+    elif compression == "zstd":
+        return zstandard.ZstdCompressor(level=level).stream_writer(open(fn, "ab", buffering=BUFFER_SIZE), closefd=True)
+    return open(fn, "ab", buffering=BUFFER_SIZE)
+
+
+#function which opens a (compressed) output file for reading text (or bytes if encoding is None)
+def open_output_file(fn, encoding="utf-8", newline=None):
+    if fn.endswith(".gz"):
+        f = gzip.open(fn, "rb")
+    elif fn.endswith(".zst"):
+        check_compression("zstd")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(fn, "rb", buffering=BUFFER_SIZE), read_across_frames=True, closefd=True)
+        f = io.BufferedReader(reader, BUFFER_SIZE)
+    else:
+        f = open(fn, "rb", buffering=BUFFER_SIZE)
+    if encoding is None:
+        return f
+    return io.TextIOWrapper(f, encoding=encoding, newline=newline)
+
+
+#function which returns True if fn is a compressed output file
+def is_compressed(fn):
+    return fn.endswith(".gz") or fn.endswith(".zst")
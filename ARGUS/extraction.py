@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+# Single-pass content extraction for the spiders.
+#
+# Instead of evaluating one "//tag/text()" XPath query per tag (each a full
+# walk over the DOM), the tree is walked once and text nodes, title, meta
+# description/keywords and link targets are collected into buckets.
+# The buckets are filled in document order, so the output is identical to
+# the per-tag XPath queries used before.
+
+#tags whose text is extracted, in output order
+TEXT_TAGS = ["p", # paragraph
+             "div", # division
+             "tr", # table row
+             "td", # table data
+             "th", # table header
+             "font", # font size, css should be used (only relevant for old websites)
+             "li", # list item
+             "small", # barely emphasized text
+             "strong", # strongly emphasized text
+             "h1", # header
+             "h2", # header
+             "h3", # header
+             "h4", # header
+             "h5", # header
+             "h6", # header
+             "span", # division for styling
+             "b", # bold text
+             "em"] # emphasized text
+
+#link tags and their url attribute, in output order
+LINK_TAGS = [("a", "href"), ("frame", "src"), ("frameset", "src")]
+LINK_ATTRIBUTES = dict(LINK_TAGS)
+
+
+class PageContent(object):
+
+    def __init__(self):
+        #text nodes are collected per tag, the title is handled like a text tag
+        self.texts = dict((tag, []) for tag in TEXT_TAGS + ["title"])
+        self.meta = {"description": [], "keywords": []}
+        self.links = dict((tag, []) for tag, attribute in LINK_TAGS)
+
+    #text in the same per-tag structure extractText produced: [[tag, [text]], ...]
+    def text(self):
+        return [[tag, [" ".join(self.texts[tag])]] for tag in TEXT_TAGS]
+
+    #title, description, keywords like extractHeader produced them
+    def header(self):
+        return " ".join(self.texts["title"]), " ".join(self.meta["description"]), " ".join(self.meta["keywords"])
+
+    #urls of all links, frames and framesets
+    def urls(self):
+        urls = []
+        for tag, attribute in LINK_TAGS:
+            urls.extend(self.links[tag])
+        return urls
+
+
+#function which walks the DOM once and collects all page content
+def extract_page(root):
+    content = PageContent()
+    texts = content.texts
+    meta = content.meta
+    links = content.links
+
+    def start(el):
+        tag = el.tag
+        if tag in texts:
+            if el.text is not None:
+                texts[tag].append(el.text)
+        elif tag in links:
+            url = el.get(LINK_ATTRIBUTES[tag])
+            if url is not None:
+                links[tag].append(url)
+        elif tag == "meta":
+            name = el.get("name")
+            if name in meta:
+                value = el.get("content")
+                if value is not None:
+                    meta[name].append(value)
+
+    #depth first walk; a tail text node belongs to the parent element and follows the
+    #child's subtree in document order (comments and processing instructions have tails too)
+    start(root)
+    stack = [(root, iter(root))]
+    while stack:
+        el, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if stack and el.tail is not None:
+                parent_tag = stack[-1][0].tag
+                if parent_tag in texts:
+                    texts[parent_tag].append(el.tail)
+        elif isinstance(child.tag, str):
+            start(child)
+            stack.append((child, iter(child)))
+        elif child.tail is not None and el.tag in texts:
+            texts[el.tag].append(child.tail)
+    return content
+
+
+#function which only collects link targets (for spiders which do not need any text)
+def extract_urls(root):
+    links = dict((tag, []) for tag, attribute in LINK_TAGS)
+    for el in root.iter(*links.keys()):
+        url = el.get(LINK_ATTRIBUTES[el.tag])
+        if url is not None:
+            links[el.tag].append(url)
+    urls = []
+    for tag, attribute in LINK_TAGS:
+        urls.extend(links[tag])
+    return urls
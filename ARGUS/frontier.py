@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# Per-website URL frontier used by the spiders.
+#
+# Replaces re-sorting the whole urlstack after every response: urls are
+# pushed once (duplicates are dropped on insert) and popped in the same order
+# the old reorderUrlstack produced, i.e. language tagged urls first and,
+# if prefer_short_urls is "on", shorter urls before longer ones.
+# Ties are resolved by insertion order. Without short url preference the
+# order is plain FIFO per language rank, so two deques are used instead of
+# the heap and every push/pop is O(1).
+
+import heapq
+from collections import deque
+
+
+class URLFrontier(object):
+
+    def __init__(self, language="", prefer_short_urls="on"):
+        #language can be given as comma separated string or as list of ISO codes
+        if isinstance(language, str):
+            language = language.split(",")
+        self.language_tags = []
+        for ISO in language:
+            if ISO == "":
+                continue
+            self.language_tags.append("/{}/".format(ISO))
+            self.language_tags.append("/{}-{}/".format(ISO, ISO))
+            self.language_tags.append("?lang={}".format(ISO))
+        self.prefer_short_urls = prefer_short_urls == "on"
+        #heap entries are (language rank, url length, insertion counter, url)
+        self.heap = []
+        #fifo queues for preferred and other language urls if short urls are not preferred
+        self.queues = (deque(), deque())
+        #all urls which have ever been pushed to the frontier
+        self.seen = set()
+        self.counter = 0
+        #fingerprints of urls which were sent out and number of requests still in flight
+        self.requested = set()
+        self.in_flight = 0
+
+    #function which returns the priority key of a url
+    def priority(self, url):
+        if any(tag in url for tag in self.language_tags):
+            rank = 0
+        else:
+            rank = 1
+        if self.prefer_short_urls:
+            return rank, len(url)
+        return rank, 0
+
+    #add a url to the frontier, returns False if it was seen before
+    def push(self, url):
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        rank, length = self.priority(url)
+        if self.prefer_short_urls:
+            heapq.heappush(self.heap, (rank, length, self.counter, url))
+            self.counter += 1
+        else:
+            self.queues[rank].append(url)
+        return True
+
+    def extend(self, urls):
+        for url in urls:
+            self.push(url)
+
+    #next url without removing it
+    def peek(self):
+        if self.prefer_short_urls:
+            return self.heap[0][-1]
+        if self.queues[0]:
+            return self.queues[0][0]
+        return self.queues[1][0]
+
+    #remove and return the next url
+    def pop(self):
+        if self.prefer_short_urls:
+            return heapq.heappop(self.heap)[-1]
+        if self.queues[0]:
+            return self.queues[0].popleft()
+        return self.queues[1].popleft()
+
+    #drop all pending urls (urls stay marked as seen)
+    def clear(self):
+        del self.heap[:]
+        self.queues[0].clear()
+        self.queues[1].clear()
+
+    def __len__(self):
+        return len(self.heap) + len(self.queues[0]) + len(self.queues[1])
+
+    #iterate pending urls (not in priority order)
+    def __iter__(self):
+        for entry in self.heap:
+            yield entry[-1]
+        for queue in self.queues:
+            for url in queue:
+                yield url
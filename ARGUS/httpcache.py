@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# Size-bounded HTTP cache storage shared by the crawls.
+#
+# Used by scrapy's HttpCacheMiddleware together with the RFC2616Policy (see
+# settings.py): on a recrawl, a cached page with an ETag or Last-Modified
+# header is requested with If-None-Match / If-Modified-Since, and a
+# "304 Not Modified" answer is served from disk. Entries are stored per
+# request fingerprint (i.e. per canonical url) with gzip compressed files.
+#
+# The storage keeps the cache below HTTPCACHE_MAX_SIZE bytes by deleting the
+# least recently used entries. The size and last use of every entry and the
+# total size are kept in an SQLite index next to the entries
+# (<cachedir>/<spider>/index.sqlite), which all jobs update, so a job does not
+# have to walk the cache when it opens and the bound holds for jobs running at
+# the same time. Only the first job after the index was created (or deleted)
+# scans the cache once to fill it, the modification time of an entry
+# directory is its last use for that.
+
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+
+logger = logging.getLogger(__name__)
+
+#entries deleted per query while the cache is too large
+EVICT_BATCH = 100
+
+
+#function which returns the size of all files of a cache entry directory
+def entry_size(path):
+    size = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                size += entry.stat().st_size
+    return size
+
+
+#function which opens (and creates) the size index of a spider's cache directory
+#the index is shared by all jobs, writes wait for each other (timeout: a first scan of a large cache can take a while)
+def open_index(spider_dir):
+    os.makedirs(spider_dir, exist_ok=True)
+    index = sqlite3.connect(os.path.join(spider_dir, "index.sqlite"), timeout=600, isolation_level=None)
+    #commits do not wait for the disk, a crash only loses the last changes of the index
+    index.execute("PRAGMA journal_mode=WAL")
+    index.execute("PRAGMA synchronous=NORMAL")
+    index.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER NOT NULL, used REAL NOT NULL)")
+    index.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+    #one row with the size of all entries, missing until the index is filled
+    index.execute("CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)")
+    return index
+
+
+class LRUFilesystemCacheStorage(FilesystemCacheStorage):
+
+    def __init__(self, settings):
+        super(LRUFilesystemCacheStorage, self).__init__(settings)
+        #0: no limit
+        self.max_size = settings.getint("HTTPCACHE_MAX_SIZE", 0)
+        self.index = None
+        self.evicted = 0
+        self.evicted_bytes = 0
+
+    def open_spider(self, spider):
+        super(LRUFilesystemCacheStorage, self).open_spider(spider)
+        self.stats = spider.crawler.stats
+        self.spider_dir = os.path.join(self.cachedir, spider.name)
+        self.index = open_index(self.spider_dir)
+        with self.transaction():
+            if self.index.execute("SELECT size FROM total").fetchone() is None:
+                self.scan()
+        self.evict()
+        entries = self.index.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        logger.info("HTTP cache in %(cachedir)s: %(entries)d entries, %(size).1f MB", {"cachedir": self.cachedir, "entries": entries, "size": self.total_size() / 1e6}, extra={"spider": spider})
+
+    #runs the statements of the with block in one write transaction of the index
+    @contextmanager
+    def transaction(self):
+        self.index.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.index.execute("ROLLBACK")
+            raise
+        self.index.execute("COMMIT")
+
+    #fills the index with the entries of the cache (<cachedir>/<spider>/<key[:2]>/<key>) and their last use
+    def scan(self):
+        started = time.time()
+        found = []
+        for prefix in os.scandir(self.spider_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                try:
+                    found.append((entry.name, entry_size(entry.path), entry.stat().st_mtime))
+                except OSError:
+                    #deleted by another scrapy process in the meantime
+                    continue
+        self.index.execute("DELETE FROM entries")
+        self.index.executemany("INSERT INTO entries (key, size, used) VALUES (?, ?, ?)", found)
+        self.index.execute("INSERT OR REPLACE INTO total (id, size) VALUES (0, ?)", (sum(size for key, size, used in found),))
+        logger.info("Indexed %(entries)d HTTP cache entries in %(seconds).1f s", {"entries": len(found), "seconds": time.time() - started})
+
+    def total_size(self):
+        return self.index.execute("SELECT size FROM total").fetchone()[0]
+
+    def entry_path(self, key):
+        return os.path.join(self.spider_dir, key[:2], key)
+
+    #records the size of an entry and marks it as used now
+    def add(self, key, size):
+        with self.transaction():
+            old = self.index.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.index.execute("INSERT OR REPLACE INTO entries (key, size, used) VALUES (?, ?, ?)", (key, size, time.time()))
+            self.index.execute("UPDATE total SET size = size + ?", (size - (old[0] if old else 0),))
+
+    #deletes the least recently used entries until the cache is below its maximum size
+    def evict(self):
+        if self.max_size <= 0 or self.total_size() <= self.max_size:
+            return
+        with self.transaction():
+            size = self.total_size()
+            while size > self.max_size:
+                oldest = self.index.execute("SELECT key, size FROM entries ORDER BY used LIMIT ?", (EVICT_BATCH,)).fetchall()
+                if not oldest:
+                    break
+                for key, entry_bytes in oldest:
+                    if size <= self.max_size:
+                        break
+                    shutil.rmtree(self.entry_path(key), ignore_errors=True)
+                    self.index.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    size -= entry_bytes
+                    self.evicted += 1
+                    self.evicted_bytes += entry_bytes
+                    self.stats.inc_value("httpcache/evicted")
+                    self.stats.inc_value("httpcache/evicted_bytes", entry_bytes)
+            self.index.execute("UPDATE total SET size = ?", (size,))
+
+    #marks an entry as used now
+    def touch(self, path):
+        try:
+            #the modification time is the last use if the index has to be rebuilt
+            os.utime(path)
+        except OSError:
+            return
+        key = os.path.basename(path)
+        if self.index.execute("UPDATE entries SET used = ? WHERE key = ?", (time.time(), key)).rowcount == 0:
+            #stored by a job which ended before it updated the index
+            self.add(key, entry_size(path))
+            self.evict()
+
+    def retrieve_response(self, spider, request):
+        try:
+            response = super(LRUFilesystemCacheStorage, self).retrieve_response(spider, request)
+        except (OSError, EOFError):
+            #entry evicted by another job while it was read
+            return None
+        if response is not None:
+            self.touch(self._get_request_path(spider, request))
+        return response
+
+    def store_response(self, spider, request, response):
+        super(LRUFilesystemCacheStorage, self).store_response(spider, request, response)
+        path = self._get_request_path(spider, request)
+        self.add(os.path.basename(path), entry_size(path))
+        self.evict()
+
+    #logs how many requests were answered by the cache
+    def close_spider(self, spider):
+        stats = self.stats.get_stats()
+        hits = stats.get("httpcache/hit", 0)
+        revalidated = stats.get("httpcache/revalidate", 0)
+        changed = stats.get("httpcache/invalidate", 0)
+        misses = stats.get("httpcache/miss", 0)
+        lookups = hits + misses + revalidated + changed
+        logger.info("HTTP cache: %(hits)d fresh hits, %(revalidated)d not modified (304), %(changed)d modified, %(misses)d misses "
+                    "(%(rate).1f %% served from cache), %(stored)d stored, %(evicted)d evicted (%(evicted_size).1f MB), %(size).1f MB in cache",
+                    {"hits": hits, "revalidated": revalidated, "changed": changed, "misses": misses,
+                     "rate": 100 * (hits + revalidated) / lookups if lookups else 0, "stored": stats.get("httpcache/store", 0),
+                     "evicted": self.evicted, "evicted_size": self.evicted_bytes / 1e6, "size": self.total_size() / 1e6}, extra={"spider": spider})
+        self.index.close()
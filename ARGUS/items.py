@@ -20,6 +20,7 @@ class Collector(scrapy.Item):
     keywords = scrapy.Field()
     scrape_counter = scrapy.Field()
     error = scrapy.Field()
+    dl_rank = scrapy.Field()
     pass
 
 class Exporter(scrapy.Item):
@@ -48,6 +49,7 @@ class LinkCollector(scrapy.Item):
     scrape_counter = scrapy.Field()
     error = scrapy.Field()
     links = scrapy.Field()
+    link_counts = scrapy.Field()
     alias = scrapy.Field()
     pass
 
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# Completion journal of the url chunks.
+#
+# The pipelines append the finished websites of their url chunk to
+# chunks/journal_<chunk>.tsv. Entries are written in groups at checkpoints,
+# after everything exported so far was flushed to disk, and every group ends
+# with the sizes (byte offsets) of the output files at that moment:
+#
+#   finished <tab> ID <tab> dl_slot
+#   open <tab> ID                  (streamed website whose pages are already in the output)
+#   checkpoint <tab> output_p1.csv=123456 <tab> website_output_p1.csv=7890
+#
+# The resume mode of start_crawl truncates the output files to the sizes of
+# their last checkpoint, removes the rows of websites which were still open,
+# and schedules all websites without a finished entry again. A group without
+# its checkpoint line (e.g. a crash while it was written) is ignored.
+
+import csv
+import io
+import os
+import sys
+
+from ARGUS.compression import open_compressed, open_output_file
+from ARGUS.exporters import BUFFER_SIZE
+
+#webpage texts can be longer than the default field size limit of the csv module
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+
+#function which returns the file name of an output path
+def file_name(fn):
+    return os.path.basename(fn)
+
+
+#function which forces the written data of a file to disk
+def sync_file(fn):
+    fd = os.open(fn, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CompletionJournal(object):
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.file = open(fn, "a", encoding="utf-8", newline="\n")
+        #finished websites since the last checkpoint
+        self.pending = []
+
+    def finished(self, ID, dl_slot):
+        self.pending.append("finished\t{}\t{}\n".format(ID, dl_slot))
+
+    #writes the finished websites, the open websites, and the sizes of the output files (list of (path, size)),
+    #the output files have to be synced to disk before
+    def checkpoint(self, sizes, open_IDs=()):
+        lines = self.pending + ["open\t{}\n".format(ID) for ID in open_IDs]
+        lines.append("checkpoint\t" + "\t".join("{}={}".format(file_name(fn), size) for fn, size in sizes) + "\n")
+        self.file.write("".join(lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        del self.pending[:]
+
+    def close(self):
+        self.file.close()
+
+
+#function which reads a journal and returns
+#the finished websites (ID -> dl_slot), the size of each output file at its last checkpoint (file name -> size),
+#and the websites which were open at a checkpoint of each output file (file name -> set of IDs)
+def read_journal(fn):
+    finished = {}
+    sizes = {}
+    open_IDs = {}
+    group_finished = {}
+    group_open = set()
+    with open(fn, encoding="utf-8", newline="\n") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            fields = line[:-1].split("\t")
+            if fields[0] == "finished" and len(fields) == 3:
+                group_finished[fields[1]] = fields[2]
+            elif fields[0] == "open" and len(fields) == 2:
+                group_open.add(fields[1])
+            elif fields[0] == "checkpoint":
+                finished.update(group_finished)
+                for entry in fields[1:]:
+                    name, size = entry.rsplit("=", 1)
+                    sizes[name] = int(size)
+                    open_IDs.setdefault(name, set()).update(group_open)
+                group_finished = {}
+                group_open = set()
+    return finished, sizes, open_IDs
+
+
+#function which rewrites an output file without the rows of the given IDs
+def remove_rows(fn, IDs):
+    tmp = fn + ".tmp"
+    if fn.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        table = pq.read_table(fn)
+        table = table.filter(pc.invert(pc.is_in(table.column("ID"), value_set=pa.array(list(IDs), pa.string()))))
+        pq.write_table(table, tmp, compression="zstd")
+    else:
+        compression = "gzip" if fn.endswith(".gz") else "zstd" if fn.endswith(".zst") else "none"
+        source = open_output_file(fn, newline="")
+        target = open_compressed(tmp, compression)
+        #rows are written the same way as by the csv exporter (tab separated, "\r\n" line ends)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter="\t")
+        try:
+            for row in csv.reader(source, delimiter="\t"):
+                if row and row[0] in IDs:
+                    continue
+                writer.writerow(row)
+                if buffer.tell() >= BUFFER_SIZE:
+                    target.write(buffer.getvalue().encode("utf-8"))
+                    buffer.seek(0)
+                    buffer.truncate()
+            target.write(buffer.getvalue().encode("utf-8"))
+        finally:
+            source.close()
+            target.close()
+    os.replace(tmp, fn)
+
+
+#function which restores the output files of an interrupted crawl to their last checkpoint and returns the finished IDs
+#output files without a checkpoint only contain unfinished websites and are deleted
+#the journals are replaced by restored_journal, which records the restored state (so a crawl can be resumed again)
+def restore_outputs(journal_files, output_files, restored_journal):
+    finished = {}
+    sizes = {}
+    open_IDs = {}
+    for fn in journal_files:
+        journal_finished, journal_sizes, journal_open = read_journal(fn)
+        finished.update(journal_finished)
+        sizes.update(journal_sizes)
+        for name, IDs in journal_open.items():
+            open_IDs.setdefault(name, set()).update(IDs)
+
+    for fn in output_files:
+        name = file_name(fn)
+        size = sizes.get(name, 0)
+        if size == 0:
+            os.remove(fn)
+            print("Removed {} (no finished websites).".format(name))
+            continue
+        if os.path.getsize(fn) > size:
+            with open(fn, "r+b", buffering=BUFFER_SIZE) as f:
+                f.truncate(size)
+            print("Truncated {} to its last checkpoint.".format(name))
+        elif os.path.getsize(fn) < size:
+            print("WARNING: {} is smaller than at its last checkpoint.".format(name))
+        #rows of streamed websites which were not finished
+        unfinished = open_IDs.get(name, set()).difference(finished)
+        if unfinished:
+            remove_rows(fn, unfinished)
+            print("Removed the rows of {} unfinished websites from {}.".format(len(unfinished), name))
+
+    if os.path.exists(restored_journal + ".tmp"):
+        os.remove(restored_journal + ".tmp")
+    journal = CompletionJournal(restored_journal + ".tmp")
+    for ID, dl_slot in finished.items():
+        journal.finished(ID, dl_slot)
+    journal.checkpoint([(fn, os.path.getsize(fn)) for fn in output_files if os.path.exists(fn)])
+    journal.close()
+    os.replace(restored_journal + ".tmp", restored_journal)
+    for fn in journal_files:
+        if fn != restored_journal:
+            os.remove(fn)
+    return finished
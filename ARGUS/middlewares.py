@@ -5,7 +5,33 @@
 # See documentation in:
 # http://doc.scrapy.org/en/latest/topics/spider-middleware.html
 
+import logging
+import zlib
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+try:
+    from scrapy.exceptions import StopDownload
+except ImportError:
+    #scrapy < 2.2
+    StopDownload = None
+from scrapy.http import Request, TextResponse
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+
+#brotli and zstandard are optional, the encodings are only accepted if they are installed
+try:
+    import brotli
+    #brotli < 1.2 cannot limit the output of a decompression step, so a tiny body could expand
+    #to gigabytes before the size check, br is then not accepted
+    brotli.Decompressor().process(b"", output_buffer_limit=1)
+except (ImportError, TypeError):
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
 
 
 class ArgusSpiderMiddleware(object):
@@ -55,3 +81,275 @@ class ArgusSpiderMiddleware(object):
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
 
+
+
+class ArgusOffsiteMiddleware(object):
+    # Replacement for scrapy's OffsiteMiddleware.
+    # scrapy compiles one regex over all allowed domains and has to recompile
+    # it whenever a domain is added (e.g. after a redirect of a start page).
+    # Here the allowed hosts are kept in a set which can be extended in O(1);
+    # a request is followed if its host or one of its parent domains is allowed.
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler.stats)
+        crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
+        return o
+
+    def process_spider_output(self, response, result, spider):
+        for x in result:
+            if isinstance(x, Request):
+                if x.dont_filter or self.should_follow(x, spider):
+                    yield x
+                else:
+                    domain = urlparse_cached(x).hostname
+                    if domain and domain not in self.domains_seen:
+                        self.domains_seen.add(domain)
+                        logger.debug("Filtered offsite request to %(domain)r: %(request)s", {'domain': domain, 'request': x}, extra={'spider': spider})
+                        self.stats.inc_value('offsite/domains')
+                    self.stats.inc_value('offsite/filtered')
+            else:
+                yield x
+
+    def should_follow(self, request, spider):
+        #no allowed domains given: follow everything
+        if self.hosts is None:
+            return True
+        host = urlparse_cached(request).hostname or ''
+        #check the host itself and all its parent domains, e.g. a.b.example.com, b.example.com, example.com, com
+        while host:
+            if host in self.hosts:
+                return True
+            host = host.partition(".")[2]
+        return False
+
+    #add a domain to the allowed hosts
+    def add_domain(self, domain):
+        if domain:
+            if self.hosts is None:
+                self.hosts = set()
+            self.hosts.add(domain.lower())
+
+    def spider_opened(self, spider):
+        allowed_domains = getattr(spider, 'allowed_domains', None)
+        if not allowed_domains:
+            self.hosts = None
+        else:
+            self.hosts = set(domain.lower() for domain in allowed_domains if domain is not None)
+        self.domains_seen = set()
+
+
+
+#size of the blocks in which response bodies are decompressed
+DECODE_BLOCK_SIZE = 64 * 1024
+
+
+class DecompressionSizeExceeded(Exception):
+    pass
+
+
+#generators which yield the decompressed body in blocks of at most DECODE_BLOCK_SIZE bytes,
+#so a small body which expands to gigabytes (zip bomb) is stopped after DOWNLOAD_MAXSIZE bytes
+def zlib_blocks(body, wbits):
+    while body:
+        d = zlib.decompressobj(wbits)
+        data = d.decompress(body, DECODE_BLOCK_SIZE)
+        while data:
+            yield data
+            if d.eof:
+                break
+            data = d.decompress(d.unconsumed_tail, DECODE_BLOCK_SIZE)
+        #several gzip members, trailing bytes which are not a gzip member are ignored
+        body = d.unused_data if wbits > zlib.MAX_WBITS and d.unused_data[:2] == b"\x1f\x8b" else b""
+
+
+def gzip_blocks(body):
+    return zlib_blocks(body, 16 + zlib.MAX_WBITS)
+
+
+def deflate_blocks(body):
+    #"deflate" should be a zlib stream, but some servers send raw deflate data
+    try:
+        zlib.decompressobj().decompress(body[:DECODE_BLOCK_SIZE], 1)
+    except zlib.error:
+        return zlib_blocks(body, -zlib.MAX_WBITS)
+    return zlib_blocks(body, zlib.MAX_WBITS)
+
+
+def brotli_blocks(body):
+    d = brotli.Decompressor()
+    data = d.process(body, output_buffer_limit=DECODE_BLOCK_SIZE)
+    while data:
+        yield data
+        data = d.process(b"", output_buffer_limit=DECODE_BLOCK_SIZE)
+
+
+def zstd_blocks(body):
+    reader = zstandard.ZstdDecompressor().stream_reader(body, read_across_frames=True)
+    data = reader.read(DECODE_BLOCK_SIZE)
+    while data:
+        yield data
+        data = reader.read(DECODE_BLOCK_SIZE)
+
+
+DECODERS = {b"gzip": gzip_blocks, b"x-gzip": gzip_blocks, b"deflate": deflate_blocks}
+if brotli is not None:
+    DECODERS[b"br"] = brotli_blocks
+if zstandard is not None:
+    DECODERS[b"zstd"] = zstd_blocks
+
+
+#function which decompresses body with the given decoder, raises DecompressionSizeExceeded
+#as soon as the decompressed size exceeds max_size (0: no limit)
+def decode_body(body, decoder, max_size):
+    blocks = []
+    size = 0
+    for block in decoder(body):
+        size += len(block)
+        if max_size and size > max_size:
+            raise DecompressionSizeExceeded(size)
+        blocks.append(block)
+    return b"".join(blocks)
+
+
+class ArgusHttpCompressionMiddleware(object):
+    # Replacement for scrapy's HttpCompressionMiddleware.
+    # Asks for gzip, deflate, br (if brotli is installed) and zstd (if zstandard
+    # is installed) compressed pages and decompresses them block by block.
+    # DOWNLOAD_MAXSIZE and DOWNLOAD_WARNSIZE are applied to the decompressed size,
+    # so a small compressed body cannot expand to gigabytes in memory.
+    # The response is dropped with IgnoreRequest like an oversized download.
+
+    def __init__(self, stats, max_size, warn_size):
+        self.stats = stats
+        self.max_size = max_size
+        self.warn_size = warn_size
+        self.accept_encoding = b", ".join(encoding for encoding in DECODERS if encoding != b"x-gzip")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('COMPRESSION_ENABLED'):
+            raise NotConfigured
+        return cls(crawler.stats, crawler.settings.getint('DOWNLOAD_MAXSIZE'), crawler.settings.getint('DOWNLOAD_WARNSIZE'))
+
+    def process_request(self, request, spider):
+        request.headers.setdefault('Accept-Encoding', self.accept_encoding)
+
+    def process_response(self, request, response, spider):
+        if request.method == 'HEAD' or not response.body:
+            return response
+        encodings = [encoding.strip().lower() for encoding in b",".join(response.headers.getlist('Content-Encoding')).split(b",")]
+        encodings = [encoding for encoding in encodings if encoding and encoding != b"identity"]
+        #unknown encodings are left to the spider
+        if not encodings or any(encoding not in DECODERS for encoding in encodings):
+            return response
+
+        max_size = request.meta.get('download_maxsize', getattr(spider, 'download_maxsize', self.max_size))
+        warn_size = request.meta.get('download_warnsize', getattr(spider, 'download_warnsize', self.warn_size))
+        body = response.body
+        try:
+            #the last encoding was applied last
+            for encoding in reversed(encodings):
+                body = decode_body(body, DECODERS[encoding], max_size)
+        except DecompressionSizeExceeded:
+            self.stats.inc_value('httpcompression/maxsize_exceeded')
+            logger.warning("Dropped %(request)s: the decompressed body is larger than DOWNLOAD_MAXSIZE (%(max_size)d bytes)", {'request': request, 'max_size': max_size}, extra={'spider': spider})
+            raise IgnoreRequest("decompressed body of {} exceeds {} bytes".format(request.url, max_size))
+        except Exception as e:
+            #zlib.error, brotli.error or zstandard.ZstdError
+            self.stats.inc_value('httpcompression/decoding_error')
+            logger.debug("Could not decompress %(request)s: %(error)s", {'request': request, 'error': e}, extra={'spider': spider})
+            raise IgnoreRequest("could not decompress {}".format(request.url))
+        if warn_size and len(body) > warn_size:
+            logger.warning("Decompressed body of %(request)s is larger than DOWNLOAD_WARNSIZE (%(size)d bytes)", {'request': request, 'size': len(body)}, extra={'spider': spider})
+
+        self.stats.inc_value('httpcompression/response_count')
+        self.stats.inc_value('httpcompression/response_bytes', len(body))
+        self.stats.inc_value('httpcompression/wire_bytes', len(response.body))
+        respcls = responsetypes.from_args(headers=response.headers, url=response.url, body=body)
+        kwargs = {'cls': respcls, 'body': body}
+        if issubclass(respcls, TextResponse):
+            #detect the encoding of the decompressed body again
+            kwargs['encoding'] = None
+        response = response.replace(**kwargs)
+        del response.headers['Content-Encoding']
+        return response
+
+
+
+class ArgusContentFilterMiddleware(object):
+    # Rejects responses which are not webpages or too large without downloading
+    # their body. A response is rejected if its Content-Type is not in
+    # ACCEPTED_CONTENT_TYPES (responses without a Content-Type are kept) or if its
+    # Content-Length is larger than DOWNLOAD_MAXSIZE. Extensionless urls to pdfs,
+    # images or other downloads are thereby stopped after a few hundred bytes.
+    # The headers_received signal does not tell the status, so such a download is
+    # stopped there without failing (StopDownload(fail=False)) and the decision is
+    # made in process_response: only 2xx responses without a Location header are
+    # rejected with IgnoreRequest and go to the errback of the spider,
+    # request.meta["rejected"] tells the reason. Redirects are followed and error
+    # pages keep their status, as their bodies are not needed.
+    # The stats count the rejections and the bytes saved (the Content-Length of
+    # stopped responses). Scrapy versions without the signal check the headers of
+    # the downloaded response instead.
+
+    def __init__(self, stats, accepted_types, max_size):
+        self.stats = stats
+        self.accepted_types = set(content_type.lower() for content_type in accepted_types)
+        self.max_size = max_size
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        accepted_types = crawler.settings.getlist('ACCEPTED_CONTENT_TYPES')
+        if not accepted_types:
+            raise NotConfigured
+        o = cls(crawler.stats, accepted_types, crawler.settings.getint('DOWNLOAD_MAXSIZE'))
+        o.early = StopDownload is not None and hasattr(signals, 'headers_received')
+        if o.early:
+            crawler.signals.connect(o.headers_received, signal=signals.headers_received)
+        return o
+
+    #returns why a response with these headers is rejected ("Content-Type" or "Size"), or None
+    def reject_reason(self, headers, body_length, request, spider):
+        content_type = headers.get('Content-Type')
+        if content_type:
+            media_type = content_type.split(b";")[0].strip().lower().decode("latin-1")
+            if media_type not in self.accepted_types:
+                return "Content-Type"
+        max_size = request.meta.get('download_maxsize', getattr(spider, 'download_maxsize', self.max_size))
+        if max_size and body_length is not None and body_length > max_size:
+            return "Size"
+        return None
+
+    def headers_received(self, headers, body_length, request, spider):
+        #twisted's UNKNOWN_LENGTH is not an int
+        if not isinstance(body_length, int):
+            body_length = None
+        reason = self.reject_reason(headers, body_length, request, spider)
+        if reason is None:
+            return
+        request.meta['_content_filter'] = reason
+        #the cut off body must not be stored by the HTTP cache
+        request.meta['dont_cache'] = True
+        #unknown body lengths (e.g. chunked transfer) are not counted
+        if body_length is not None and body_length >= 0:
+            self.stats.inc_value('contentfilter/bytes_saved', body_length)
+        else:
+            self.stats.inc_value('contentfilter/unknown_length')
+        raise StopDownload(fail=False)
+
+    def process_response(self, request, response, spider):
+        reason = request.meta.pop('_content_filter', None)
+        if not 200 <= response.status < 300 or 'Location' in response.headers:
+            return response
+        if not self.early or 'cached' in response.flags:
+            reason = self.reject_reason(response.headers, None, request, spider)
+        if reason is None:
+            return response
+        request.meta['rejected'] = reason
+        self.stats.inc_value('contentfilter/rejected/{}'.format(reason.lower()))
+        logger.debug("Rejected %(request)s (%(reason)s)", {'request': request, 'reason': reason}, extra={'spider': spider})
+        raise IgnoreRequest("{} rejected ({})".format(request.url, reason))
@@ -5,120 +5,256 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: http://doc.scrapy.org/en/latest/topics/item-pipeline.html
 
-from scrapy.exporters import CsvItemExporter
-from ARGUS.items import Exporter, LinkExporter
-import time
-import datetime
+from ARGUS.exporters import BatchCsvItemExporter, ParquetItemExporter, BUFFER_SIZE, clean, timestamp
+from ARGUS.compression import COMPRESSION_EXTENSIONS, check_compression, open_compressed
+from ARGUS.journal import CompletionJournal, sync_file
 import os
+import time
 
-class TextPipeline(object):
+
+class OutputPipeline(object):
+    
+    #output settings, see OUTPUT_FORMAT and OUTPUT_COMPRESSION in settings.py
+    output_format = "csv"
+    compression = "none"
+    compression_level = None
+    flush_interval = 60
+    stats = None
     
+    #columns of the output file and columns stored as integers in parquet files
+    fields_to_export = []
+    int_fields = []
     
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls()
+        pipeline.output_format = crawler.settings.get("OUTPUT_FORMAT", "csv")
+        pipeline.compression = crawler.settings.get("OUTPUT_COMPRESSION", "none")
+        pipeline.compression_level = crawler.settings.get("OUTPUT_COMPRESSION_LEVEL")
+        if pipeline.compression_level is not None:
+            pipeline.compression_level = int(pipeline.compression_level)
+        pipeline.flush_interval = crawler.settings.getfloat("OUTPUT_FLUSH_INTERVAL", 60)
+        pipeline.stats = crawler.stats
+        return pipeline
+    
+    #open the output file of the spider's url chunk
     def open_spider(self, spider):
+        self.outputs = []
+        self.start_time = time.time()
+        self.open_journal(spider)
+        self.exporter = self.open_output(spider, "output", self.fields_to_export, self.int_fields)
+    
+    #opens chunks/journal_<chunk>.tsv, which records the finished websites for resuming an interrupted crawl
+    def open_journal(self, spider):
+        chunk = os.path.basename(spider.url_chunk).split(".")[0].split("_")[-1]
+        self.journal = CompletionJournal(os.path.join(os.getcwd(), "chunks", "journal_" + chunk + ".tsv"))
+        self.last_checkpoint = time.time()
+        #IDs of streamed websites which have rows in the output but are not finished yet
+        self.open_IDs = set()
+    
+    #records a finished website, the journal is written at the next checkpoint
+    def website_finished(self, ID, dl_slot):
+        self.journal.finished(ID, dl_slot)
+        #parquet files are only readable once they are closed, so they are only checkpointed in close_spider
+        if self.output_format != "parquet" and time.time() - self.last_checkpoint >= self.flush_interval:
+            self.checkpoint()
+    
+    #flushes everything exported so far to disk and writes the finished websites and the output sizes to the journal
+    def checkpoint(self):
+        for i, (fn, initial_size, fileobj, exporter) in enumerate(self.outputs):
+            exporter.flush()
+            if self.compression == "none":
+                fileobj.flush()
+            else:
+                #the compressed stream is ended and a new one is appended to the file,
+                #so that the file can be truncated to this checkpoint
+                fileobj.close()
+                fileobj = exporter.file = open_compressed(fn, self.compression, self.compression_level)
+                self.outputs[i] = (fn, initial_size, fileobj, exporter)
+            sync_file(fn)
+        self.journal.checkpoint([(fn, os.path.getsize(fn)) for fn, initial_size, fileobj, exporter in self.outputs], self.open_IDs)
+        self.last_checkpoint = time.time()
+    
+    #opens chunks\<prefix>_<chunk>.csv (or .parquet) and returns its exporter
+    def open_output(self, spider, prefix, fields_to_export, int_fields=()):
         url_chunk = spider.url_chunk
-        chunk = url_chunk.split(".")[0].split("_")[-1]
-        try:
-            self.fileobj = open(os.getcwd() +"\\chunks\\output_" + chunk + ".csv", "ab")
-        except:
-            self.fileobj = open(os.getcwd() +"\\chunks\\output_" + chunk + ".csv", "wb")
-        self.exporter = CsvItemExporter(self.fileobj, encoding='utf-8', delimiter="\t")
-        self.exporter.fields_to_export = ["ID", "dl_rank", "dl_slot", "error", "redirect", "start_page", "title", "keywords", "description", "text", "timestamp", "url"]
-        self.exporter.start_exporting()
-    
-    #close file when finished
+        chunk = os.path.basename(url_chunk).split(".")[0].split("_")[-1]
+        if self.output_format == "parquet":
+            #parquet files cannot be appended to, a restarted job writes an additional part file
+            fn = os.path.join(os.getcwd(), "chunks", prefix + "_" + chunk + ".parquet")
+            part = 1
+            while os.path.exists(fn):
+                part += 1
+                fn = os.path.join(os.getcwd(), "chunks", prefix + "_" + chunk + "_" + str(part) + ".parquet")
+            initial_size = 0
+            fileobj = open(fn, "wb", buffering=BUFFER_SIZE)
+            #parquet compresses internally, OUTPUT_COMPRESSION only selects the codec
+            exporter = ParquetItemExporter(fileobj, fields_to_export, int_fields=int_fields,
+                                           compression="zstd" if self.compression == "none" else self.compression,
+                                           compression_level=self.compression_level)
+        else:
+            check_compression(self.compression)
+            fn = os.path.join(os.getcwd(), "chunks", prefix + "_" + chunk + ".csv" + COMPRESSION_EXTENSIONS[self.compression])
+            initial_size = os.path.getsize(fn) if os.path.exists(fn) else 0
+            fileobj = open_compressed(fn, self.compression, self.compression_level)
+            exporter = BatchCsvItemExporter(fileobj, fields_to_export, encoding='utf-8', delimiter="\t", flush_interval=self.flush_interval)
+        exporter.start_exporting()
+        self.outputs.append((fn, initial_size, fileobj, exporter))
+        return exporter
+    
+    #close files when finished
+    def close_spider(self, spider):
+        for fn, initial_size, fileobj, exporter in self.outputs:
+            exporter.finish_exporting()
+            fileobj.close()
+            sync_file(fn)
+        self.journal.checkpoint([(fn, os.path.getsize(fn)) for fn, initial_size, fileobj, exporter in self.outputs], self.open_IDs)
+        self.journal.close()
+        self.report(spider)
+    
+    #log size, compression ratio, and throughput of the written output
+    def report(self, spider):
+        total_exported = total_written = total_seconds = 0
+        for fn, initial_size, fileobj, exporter in self.outputs:
+            exported = exporter.bytes_exported
+            written = os.path.getsize(fn) - initial_size
+            ratio = exported / written if written else 0
+            throughput = exported / exporter.write_seconds / 1e6 if exporter.write_seconds else 0
+            spider.logger.info("Output: {:.1f} MB of data written as {:.1f} MB to {} (compression ratio {:.2f}, {:.1f} MB/s while writing, {:.1f} MB/s over the whole job)"
+                               .format(exported / 1e6, written / 1e6, fn, ratio, throughput, exported / max(time.time() - self.start_time, 1e-6) / 1e6))
+            total_exported += exported
+            total_written += written
+            total_seconds += exporter.write_seconds
+        if self.stats is not None:
+            self.stats.set_value("argus/output/bytes", total_exported)
+            self.stats.set_value("argus/output/bytes_written", total_written)
+            self.stats.set_value("argus/output/compression_ratio", round(total_exported / total_written, 2) if total_written else 0)
+            self.stats.set_value("argus/output/write_seconds", round(total_seconds, 2))
+
+
+class TextPipeline(OutputPipeline):
+    
+    fields_to_export = ["ID", "dl_rank", "dl_slot", "error", "redirect", "start_page", "title", "keywords", "description", "text", "timestamp", "url"]
+    int_fields = ["dl_rank"]
+    #columns of the website-level output (same as the output of bin/aggregator.py)
+    website_fields = ["ID", "dl_rank", "dl_slot", "error", "redirect", "start_page", "title", "keywords", "description", "text", "timestamp"]
+    
+    #"webpage" writes one row per webpage to output_pN, "website" one row per website to website_output_pN, "both" writes both
+    output_level = "webpage"
+    
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = super(TextPipeline, cls).from_crawler(crawler)
+        pipeline.output_level = crawler.settings.get("OUTPUT_LEVEL", "webpage")
+        return pipeline
+    
+    def open_spider(self, spider):
+        self.outputs = []
+        self.start_time = time.time()
+        self.open_journal(spider)
+        self.exporter = None
+        self.website_exporter = None
+        if self.output_level in ("webpage", "both"):
+            self.exporter = self.open_output(spider, "output", self.fields_to_export, self.int_fields)
+        if self.output_level in ("website", "both"):
+            self.website_exporter = self.open_output(spider, "website_output", self.website_fields, self.int_fields)
+        #websites whose pages are still being collected, by ID: website row with a list of the page texts
+        self.websites = {}
+    
+    #write websites which were not finished (e.g. if the job was stopped)
     def close_spider(self, spider):
-        self.exporter.finish_exporting()
-        self.fileobj.close()
-        
+        for ID in list(self.websites):
+            self.export_website(ID)
+        super(TextPipeline, self).close_spider(spider)
+    
+    def export_website(self, ID):
+        website = self.websites.pop(ID, None)
+        if website is not None:
+            website[9] = "".join(website[9])
+            self.website_exporter.export_row(website)
     
     def process_item(self, item, spider):
         #get scraped text from collector item
-        scraped_text = item["scraped_text"]
+        #(streamed pages carry one page and its dl_rank, the closing item of a streamed website carries no pages)
+        scraped_text = item.get("scraped_text", [])
+        first_rank = item.get("dl_rank", [0])[0]
+        #website-level fields are the same for all pages
+        ID = item["ID"][0]
+        dl_slot = item["dl_slot"][0]
+        error = (self.exporter or self.website_exporter).serialize(item["error"])
+        redirect = item["redirect"][0]
+        start_page = item["start_page"][0]
         c=0
         #iterate site chunks
         for sitechunk in scraped_text:
-            #initialise one exporter item per url and fill with info from collector item
-            site = Exporter()
-            site["dl_slot"] = item["dl_slot"][0]
-            site["start_page"] = item["start_page"][0]
-            site["url"] = item["scraped_urls"][c]
-            site["redirect"] = item["redirect"][0]
-            site["error"] = item["error"]
-            site["ID"] = item["ID"][0]
-            
-            # add title, description, and keywords to the output
-            title = item["title"][c]
-            description = item["description"][c]
-            keywords = item["keywords"][c]
-            site["title"] = title.replace("\n", "").replace("\t", "").replace("\r\n", "").replace("\r", "")
-            site["description"] = description.replace("\n", "").replace("\t", "").replace("\r\n", "").replace("\r", "")
-            site["keywords"] = keywords.replace("\n", "").replace("\t", "").replace("\r\n", "").replace("\r", "")
-            
             #generate site text
-            site_text = ""
+            text_pieces = []
             #iterate extracted tag texts, clean them and merge them
+            #(splitting and joining already removes all line breaks and tabs)
             for tagchunk in sitechunk:
-                text_piece = tagchunk[-1]
-                text_piece = " ".join(text_piece[0].split())
-                text_piece = text_piece.replace("\n", "").replace("\t", "").replace("\r\n", "").replace("\r", "")
+                text_piece = " ".join(tagchunk[-1][0].split())
                 #if empty skip
-                if text_piece.strip().strip('"') == "":
+                if text_piece.strip('"') == "":
                     continue
-                #add tag text to site text
-                site_text = site_text + text_piece
+                text_pieces.append(text_piece)
+            text = "".join(text_pieces)
+
+            #write one row per url, the order of the values is given by fields_to_export
+            if self.exporter is not None:
+                self.exporter.export_row([ID, first_rank + c, dl_slot, error, redirect, start_page,
+                                          clean(item["title"][c]), clean(item["keywords"][c]), clean(item["description"][c]),
+                                          text, timestamp(), item["scraped_urls"][c]])
 
-            #add text and timestamp to exporter item and export it
-            site["text"] = site_text            
-            site["timestamp"] = datetime.datetime.fromtimestamp(time.time()).strftime("%c")
-            site["dl_rank"] = c
-            self.exporter.export_item(site)
+            #collect the website row: fields of the first page, dl_rank of the last page, texts of all pages
+            if self.website_exporter is not None:
+                website = self.websites.get(ID)
+                if website is None:
+                    website = self.websites[ID] = [ID, first_rank + c, dl_slot, error, redirect, start_page,
+                                                   clean(item["title"][c]), clean(item["keywords"][c]), clean(item["description"][c]),
+                                                   [], timestamp()]
+                website[1] = first_rank + c
+                website[9].append(text)
             
             c+=1
 
+        #a website is complete unless the item is a streamed page (the closing item of a streamed website follows)
+        if "dl_rank" in item:
+            self.open_IDs.add(ID)
+        else:
+            if self.website_exporter is not None:
+                self.export_website(ID)
+            self.open_IDs.discard(ID)
+            self.website_finished(ID, dl_slot)
 
         return
 
 
-class LinkPipeline(object):
+class LinkPipeline(OutputPipeline):
     
+    #columns in the order of the LinkExporter item fields
+    fields_to_export = ["ID", "alias", "dl_slot", "error", "links", "redirect", "timestamp", "url"]
     
-    def open_spider(self, spider):
-        url_chunk = spider.url_chunk
-        chunk = url_chunk.split(".")[0].split("_")[-1]
-        try:
-            self.fileobj = open(os.getcwd() +"\\chunks\\output_" + chunk + ".csv", "ab")
-        except:
-            self.fileobj = open(os.getcwd() +"\\chunks\\output_" + chunk + ".csv", "wb")
-        self.exporter = CsvItemExporter(self.fileobj, encoding='utf-8', delimiter="\t")
-        self.exporter.start_exporting()
-    
-    #close file when finished
-    def close_spider(self, spider):
-        self.exporter.finish_exporting()
-        self.fileobj.close()
-        
+    #if True, a link_counts column is added: "domain:number of urls" for each linked domain
+    link_counts = False
+    
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = super(LinkPipeline, cls).from_crawler(crawler)
+        pipeline.link_counts = crawler.settings.getbool("OUTPUT_LINK_COUNTS", False)
+        if pipeline.link_counts:
+            pipeline.fields_to_export = cls.fields_to_export + ["link_counts"]
+        return pipeline
     
     def process_item(self, item, spider):
-        #get scraped text from collector item
-        site = LinkExporter()
-        site["dl_slot"] = item["dl_slot"][0]
-        site["url"] = item["scraped_urls"][0]
-        site["redirect"] = item["redirect"][0]
-        site["error"] = item["error"]
-        site["ID"] = item["ID"][0]
-        site["alias"] = item["alias"][0]
-        site["timestamp"] = datetime.datetime.fromtimestamp(time.time()).strftime("%c")
-        links = []
-        #iterate site chunks
-        for link in item["links"]:
-            #add collected links to link list if not included yet
-            if link != "":
-                if link not in links:
-                    links.append(link)
-            
-            
+        #collected links without empty entries and duplicates (keeping the order they were found in)
+        links = [link for link in dict.fromkeys(item["links"]) if link != ""]
+        row = [item["ID"][0], item["alias"][0], item["dl_slot"][0], self.exporter.serialize(item["error"]),
+               ",".join(links), item["redirect"][0], timestamp(), item["scraped_urls"][0]]
+        if self.link_counts:
+            counts = item.get("link_counts", [{}])[0]
+            row.append(",".join("{}:{}".format(link, counts[link]) for link in links if link in counts))
         #add links and export
-        site["links"] = links
-        self.exporter.export_item(site)
+        self.exporter.export_row(row)
+        self.website_finished(item["ID"][0], item["dl_slot"][0])
 
         return
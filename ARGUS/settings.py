@@ -45,7 +45,14 @@ LOG_LEVEL = "INFO"
 
 AJAXCRAWL_ENABLED = True
 
-COMPRESSION_ENABLED = False
+# Responses with another Content-Type are stopped as soon as their headers arrive
+# (see ArgusContentFilterMiddleware, an empty list disables the filter), as well as
+# responses with a Content-Length above DOWNLOAD_MAXSIZE
+ACCEPTED_CONTENT_TYPES = ['text/html', 'application/xhtml+xml']
+
+# Request gzip/deflate/br/zstd compressed pages (see ArgusHttpCompressionMiddleware),
+# DOWNLOAD_MAXSIZE applies to the decompressed size
+COMPRESSION_ENABLED = True
 
 # Configure a delay for requests for the same website (default: 0)
 # See http://scrapy.readthedocs.org/en/latest/topics/settings.html#download-delay
@@ -68,16 +75,21 @@ DEFAULT_REQUEST_HEADERS = {
 
 # Enable or disable spider middlewares
 # See http://scrapy.readthedocs.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
-#    'ARGUS.middlewares.ARGUSSpiderMiddleware': 543,
-#}
+# The offsite middleware is replaced by one with an incremental host registry,
+# spiders add redirect domains to it without rebuilding a regex
+SPIDER_MIDDLEWARES = {
+    'scrapy.spidermiddlewares.offsite.OffsiteMiddleware': None,
+    'ARGUS.middlewares.ArgusOffsiteMiddleware': 500,
+}
 
 # Enable or disable downloader middlewares
 # See http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
     'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
     'scrapy_fake_useragent.middleware.RandomUserAgentMiddleware': 400,
-    'scrapy.downloadermiddlewares.httpcompression.HttpCompressionMiddleware': None
+    'scrapy.downloadermiddlewares.httpcompression.HttpCompressionMiddleware': None,
+    'ARGUS.middlewares.ArgusHttpCompressionMiddleware': 590,
+    'ARGUS.middlewares.ArgusContentFilterMiddleware': 595,
 }
 
 # Enable or disable extensions
@@ -94,6 +106,26 @@ EXTENSIONS = {'scrapy.contrib.feedexport.FeedExporter': None}
 #    'ARGUS.pipelines.LinkPipeline': 300,
 #}
 
+# Output format of the pipelines: "csv" (tab separated) or "parquet"
+# (zstd compressed row groups, requires pyarrow)
+OUTPUT_FORMAT = "csv"
+
+# Compression of csv output files: "none", "gzip" or "zstd" (requires zstandard),
+# for parquet files it selects the codec (zstd by default)
+OUTPUT_COMPRESSION = "none"
+# Compression level, None uses the default of the codec
+OUTPUT_COMPRESSION_LEVEL = None
+# Seconds after which buffered csv output is flushed to disk at the latest
+OUTPUT_FLUSH_INTERVAL = 60
+
+# Rows written by the TextPipeline: "webpage" (one row per webpage), "website"
+# (one aggregated row per website) or "both"
+OUTPUT_LEVEL = "webpage"
+
+# Adds a link_counts column to the LinkPipeline output: the number of distinct
+# urls found for each linked domain ("domain:count,...")
+OUTPUT_LINK_COUNTS = False
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See http://doc.scrapy.org/en/latest/topics/autothrottle.html
 #AUTOTHROTTLE_ENABLED = True
@@ -107,10 +139,14 @@ EXTENSIONS = {'scrapy.contrib.feedexport.FeedExporter': None}
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
-# Enable and configure HTTP caching (disabled by default)
+# HTTP cache across crawls (disabled by default, enabled by the http_cache setting of start_crawl)
 # See http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = 'httpcache'
-#HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+# Stale pages with an ETag or Last-Modified header are revalidated with a conditional
+# request, "304 Not Modified" answers are served from the cache
+HTTPCACHE_ENABLED = False
+HTTPCACHE_POLICY = 'scrapy.extensions.httpcache.RFC2616Policy'
+HTTPCACHE_STORAGE = 'ARGUS.httpcache.LRUFilesystemCacheStorage'
+HTTPCACHE_DIR = 'httpcache'
+HTTPCACHE_GZIP = True
+# Maximum size of the cache in bytes, the least recently used pages are deleted first (0: no limit)
+HTTPCACHE_MAX_SIZE = 10000000000
@@ -1,14 +1,16 @@
 # -*- coding: utf-8 -*-
 import scrapy
-import tldextract
 from ARGUS.items import LinkCollector
+from ARGUS.frontier import URLFrontier
+from ARGUS.middlewares import ArgusOffsiteMiddleware
+from ARGUS.urllist import read_url_chunk
 from scrapy.loader import ItemLoader
-from scrapy.utils.request import request_fingerprint
+from ARGUS.extraction import extract_urls
+from ARGUS.urlutils import url_fingerprint, subdomain, registered_domain, cache_snapshot, cache_stats
 import re
 from scrapy.spidermiddlewares.httperror import HttpError
 from twisted.internet.error import DNSLookupError
 from twisted.internet.error import TimeoutError, TCPTimedOutError
-import pandas as pd
 
 class LinkspiderSpider(scrapy.Spider):
     name = 'linkspider'
@@ -22,17 +24,21 @@ class LinkspiderSpider(scrapy.Spider):
 ##################################################################
     
     #load URLs from text file defined in given parameter
-    def __init__(self, url_chunk="", limit=5, ID="ID", url_col="url", language="", prefer_short_urls="on", *args, **kwargs):
+    def __init__(self, url_chunk="", limit=5, ID="ID", url_col="url", language="", prefer_short_urls="on", per_site_parallelism=1, *args, **kwargs):
         super(LinkspiderSpider, self).__init__(*args, **kwargs)
-        #loads urls and IDs from text file
-        data = pd.read_csv(url_chunk, delimiter="\t", encoding="utf-8", error_bad_lines=False, engine="python")
-        self.allowed_domains = [url.split("www.")[-1].lower() for url in list(data[url_col])]
-        self.start_urls = ["http://" + url.lower() for url in self.allowed_domains]
-        self.IDs = [ID for ID in list(data[ID])]
+        #the url chunk is streamed, start urls and IDs are read lazily in start_requests
+        self.ID_col = ID
+        self.url_col = url_col
+        #set of allowed domains, so that checking a link's domain is O(1)
+        self.allowed_domains = set(domain for ID, domain in read_url_chunk(url_chunk, ID, url_col))
         self.site_limit = int(limit)
         self.url_chunk = url_chunk
         self.language = language.split(",")
         self.prefer_short_urls = prefer_short_urls
+        #max number of subpage requests of one website which are in flight at the same time
+        self.per_site_parallelism = max(int(per_site_parallelism), 1)
+        #counters of the url caches when the crawl starts, the stats only count this crawl
+        self.cache_snapshot = cache_snapshot()
     
     
 ##################################################################
@@ -50,59 +56,47 @@ class LinkspiderSpider(scrapy.Spider):
                 '3gp?download=true', 'asf?download=true', 'asx?download=true', 'avi?download=true', 'mov?download=true', 'mp4?download=true', 'mpg?download=true', 'qt?download=true', 'rm?download=true', 'swf?download=true', 'wmv?download=true', 'm4a?download=true',
                 'css?download=true', 'pdf?download=true', 'doc?download=true', 'exe?download=true', 'bin?download=true', 'rss?download=true', 'zip?download=true', 'rar?download=true', 'msu?download=true', 'flv?download=true',  'dmg?download=true'])
 
-    #function to refresh the allowed domain list after adding domains
-    def refreshAllowedDomains(self):
+    #function to add a domain to the allowed hosts of the offsite middleware
+    #(no rebuild of the allowed domain index, adding is O(1))
+    def refreshAllowedDomains(self, domain):
         for mw in self.crawler.engine.scraper.spidermw.middlewares:
-            if isinstance(mw, scrapy.spidermiddlewares.offsite.OffsiteMiddleware):
-                mw.spider_opened(self)
+            if isinstance(mw, ArgusOffsiteMiddleware):
+                mw.add_domain(domain)
            
     #function which extracts the subdomain from a url string or response object
+    #(resolved hosts are cached and shared by all spiders in the process)
     def subdomainGetter(self, response):
         #if string
         if isinstance(response, str):
-            tld = tldextract.extract(response)
-            if tld.subdomain != "":
-                domain = tld.subdomain + "." + tld.registered_domain
-                return domain
-            else:
-                domain = tld.registered_domain
-                return domain            
+            return subdomain(response)
         #if scrapy response object
         else:
-            tld = tldextract.extract(response.url)
-            if tld.subdomain != "":
-                domain = tld.subdomain + "." + tld.registered_domain
-                return domain
-            else:
-                domain = tld.registered_domain
-                return domain
+            return subdomain(response.url)
         
+    #function which adds the domains of newly found urls to the website's links (domain -> number of urls),
+    #urls to the website's own domain or its alias are skipped
+    def collectLinks(self, loader, links, urls):
+        own_domain = self.subdomainGetter(loader.get_collected_values("dl_slot")[0])
+        alias_domain = self.subdomainGetter(loader.get_collected_values("alias")[0])
+        for url in urls:
+            url = url.replace("\r\n", "")
+            url = url.replace("\n", "")
+            domain = self.subdomainGetter(url).split("www.")[-1]
+            if domain != own_domain and domain != alias_domain:
+                links[domain] = links.get(domain, 0) + 1
+
     #function which checks if there has been a redirect from the starting url
     def checkRedirectDomain(self, response):
-        return tldextract.extract(response.url).registered_domain != tldextract.extract(response.request.meta.get("download_slot")).registered_domain
+        return registered_domain(response.url) != registered_domain(response.request.meta.get("download_slot"))
     
-    #function which reorders the urlstack, giving highest priority to short urls and language tagged urls
-    def reorderUrlstack(self, urlstack, language, prefer_short_urls):
-       preferred_language = []
-       other_language = []
-       language_tags = []
-       if language == "":
-           preferred_language = urlstack
-       else:
-           for ISO in language:
-               language_tags.append("/{}/".format(ISO))
-               language_tags.append("/{}-{}/".format(ISO, ISO))
-               language_tags.append("?lang={}".format(ISO))
-           for url in urlstack:
-               if any(tag in url for tag in language_tags):
-                   preferred_language.append(url)
-               else:
-                   other_language.append(url)
-       if prefer_short_urls == "on":
-           urlstack = sorted(preferred_language, key=len) + sorted(other_language, key=len)
-       else:
-           urlstack = preferred_language + other_language
-       return urlstack
+    #function which extracts the urls of links and frames in a single walk over the DOM
+    def extractURLs(self, response):
+        return extract_urls(response.selector.root)
+
+    #function which writes the hit rates of the url caches to the crawl stats when the spider closes
+    def closed(self, reason):
+        for key, value in cache_stats(self.cache_snapshot).items():
+            self.crawler.stats.set_value(key, value)
    
    
 ##################################################################
@@ -111,11 +105,8 @@ class LinkspiderSpider(scrapy.Spider):
     
     #start request and add ID to meta
     def start_requests(self):
-        i = -1
-        for url in self.start_urls:
-            i += 1
-            ID = self.IDs[i]
-            yield scrapy.Request(url, callback=self.parse, meta={"ID": ID}, dont_filter=True, errback=self.errorback)
+        for ID, domain in read_url_chunk(self.url_chunk, self.ID_col, self.url_col):
+            yield scrapy.Request("http://" + domain, callback=self.parse, meta={"ID": ID}, dont_filter=True, errback=self.errorback)
     
     #errorback creates an collector item, records the error type, and passes it to the pipeline   
     def errorback(self, failure):
@@ -163,7 +154,8 @@ class LinkspiderSpider(scrapy.Spider):
             loader.add_value("scraped_urls", "")
             loader.add_value("redirect", [None])
             loader.add_value("scraped_text", "")
-            loader.add_value("error", "other")
+            #pages rejected by ArgusContentFilterMiddleware record the reason ("Content-Type" or "Size")
+            loader.add_value("error", request.meta.get("rejected", "other"))
             loader.add_value("ID", request.meta["ID"])
             loader.add_value("links", "")
             loader.add_value("alias", "")
@@ -196,23 +188,27 @@ class LinkspiderSpider(scrapy.Spider):
         #initialize the fingerprints set which stores all fingerprints of visited websites
         fingerprints = set()
         #add the fingerprints of the start_page
-        fingerprints.add(request_fingerprint(response.request))
+        fingerprints.add(url_fingerprint(response.request.url))
         
         #if there was an initial redirect, the new domain is added to the allowed domains
         domain = self.subdomainGetter(response)
         if domain not in self.allowed_domains:
-            self.allowed_domains.append(domain)
-            self.refreshAllowedDomains()
+            self.allowed_domains.add(domain)
+            self.refreshAllowedDomains(domain)
 
         #extract all urls from the page...
-        urls = response.xpath("//a/@href").extract() + response.xpath("//frame/@src").extract() + response.xpath("//frameset/@src").extract()
-        #...and safe them to a urlstack
-        urlstack = [response.urljoin(url) for url in urls]
+        urls = self.extractURLs(response)
+        #...and safe them to a urlstack which keeps the most relevant urls in front
+        urlstack = URLFrontier(self.language, self.prefer_short_urls)
+        #the domains of newly found urls are collected once into the website's links (domain -> number of urls)
+        links = {}
+        self.collectLinks(loader, links, [url for url in (response.urljoin(url) for url in urls) if urlstack.push(url)])
             
-        #attach the urlstack, the loader, and the fingerprints to the response...        
+        #attach the urlstack, the loader, the fingerprints, and the links to the response...        
         response.meta["urlstack"] = urlstack
         response.meta["loader"] = loader
         response.meta["fingerprints"] = fingerprints
+        response.meta["links"] = links
         #...and send it over to the processURLstack function
         return self.processURLstack(response)
     
@@ -228,59 +224,73 @@ class LinkspiderSpider(scrapy.Spider):
         loader = meta["loader"]
         urlstack = meta["urlstack"]
         fingerprints = meta["fingerprints"]
+        links = meta["links"]
+        output = []
+
+        #a subpage request came back (response or failure), so it is not in flight anymore
+        #(only once per request, parse_subpage falls back to processURLstack in case of errors)
+        if meta.get("subpage") and not meta.get("counted"):
+            meta["counted"] = True
+            urlstack.in_flight -= 1
         
-        #check whether max number of webpages has been scraped for this website
         #check whether max number of webpages has been scraped for this website
         if self.site_limit != 0:
             if loader.get_collected_values("scrape_counter")[0] >= self.site_limit:
-                del urlstack[:]
-        
-        #reorder the urlstack to scrape the most relevant urls first
-        urlstack = self.reorderUrlstack(urlstack, self.language, self.prefer_short_urls)
-        
-        #check urlstack for links to other domains
-        for url in urlstack:
-            url = url.replace("\r\n", "")
-            url = url.replace("\n", "")
-            domain = self.subdomainGetter(url).split("www.")[-1] 
-            #if url points to domain that is not the orinigally requested domain...
-            if domain == self.subdomainGetter(loader.get_collected_values("dl_slot")[0]):
-                continue
-            #...and also not the alias domain...
-            elif domain == self.subdomainGetter(loader.get_collected_values("alias")[0]):
-                continue
-            #...add domain to link list
-            else:
-                loader.add_value("links", domain)
+                urlstack.clear()
             
-        #check if the next url in the urlstack is valid
-        while len(urlstack) > 0:
-            #pop non-valid domains
-            domain = self.subdomainGetter(urlstack[0])
-            if domain not in self.allowed_domains:
-                urlstack.pop(0)
-            #pop "mailto" urls
-            elif re.match(r"mailto", urlstack[0]):
-                urlstack.pop(0)
-            #pop unwanted filetypes
-            elif urlstack[0].split(".")[-1].lower() in self.filetypes:
-                urlstack.pop(0)
-            #pop visited urls 
-            #(potential bottleneck: Request has to be sent to generate fingerprint from)
-            elif request_fingerprint(scrapy.Request(urlstack[0], callback=None)) in fingerprints:
-                urlstack.pop(0)
-            else:
+        #send out requests until the per-website parallelism is reached
+        #(pages in flight count towards the scrape limit, so that the limit is never exceeded)
+        scrape_counter = loader.get_collected_values("scrape_counter")[0]
+        while urlstack.in_flight < self.per_site_parallelism:
+            if self.site_limit != 0 and scrape_counter + urlstack.in_flight >= self.site_limit:
                 break
 
-        #if the url was assessed to be valid, send out a request and callbak the parse_subpage function
-        #errbacks return to processURLstack
-        #ALLOW ALL HTTP STATUS: 
-        #errors must to be catched in the callback function, because middleware catched request break the sequence and collector items get lost
-        if len(urlstack) > 0:
-            yield scrapy.Request(urlstack.pop(0), meta={"loader": loader, "urlstack": urlstack, "fingerprints": fingerprints, 'handle_httpstatus_all': True}, dont_filter=True, callback=self.parse_subpage, errback=self.processURLstack)
-        #if there are no urls left in the urlstack, the website was scraped completely and the item can be sent to the pipeline
-        else:
-            yield loader.load_item()
+            #check if the next url in the urlstack is valid
+            while len(urlstack) > 0:
+                url = urlstack.peek()
+                try:
+                    #pop non-valid domains
+                    domain = self.subdomainGetter(url)
+                    if domain not in self.allowed_domains:
+                        urlstack.pop()
+                    #pop "mailto" urls
+                    elif re.match(r"mailto", url):
+                        urlstack.pop()
+                    #pop unwanted filetypes
+                    elif url.split(".")[-1].lower() in self.filetypes:
+                        urlstack.pop()
+                    else:
+                        fingerprint = url_fingerprint(url)
+                        #pop visited or already requested urls
+                        if fingerprint in fingerprints or fingerprint in urlstack.requested:
+                            urlstack.pop()
+                        else:
+                            break
+                #pop urls which cannot be parsed (e.g. "http://www.a.com:abc/")
+                except ValueError:
+                    urlstack.pop()
+            if len(urlstack) == 0:
+                break
+
+            #if the url was assessed to be valid, send out a request and callback the parse_subpage function
+            #errbacks return to processURLstack
+            #ALLOW ALL HTTP STATUS: 
+            #errors must be caught in the callback function, because middleware caught request break the sequence and collector items get lost
+            url = urlstack.pop()
+            try:
+                request = scrapy.Request(url, meta={"loader": loader, "urlstack": urlstack, "fingerprints": fingerprints, "links": links, "subpage": True, 'handle_httpstatus_all': True}, dont_filter=True, callback=self.parse_subpage, errback=self.processURLstack)
+            except ValueError:
+                continue
+            urlstack.requested.add(fingerprint)
+            urlstack.in_flight += 1
+            output.append(request)
+
+        #if there are no urls left in the urlstack and no request is in flight, the website was scraped completely and the item can be sent to the pipeline
+        if urlstack.in_flight == 0:
+            loader.add_value("links", list(links))
+            loader.add_value("link_counts", links)
+            output.append(loader.load_item())
+        return output
     
     
 ##################################################################
@@ -289,10 +299,10 @@ class LinkspiderSpider(scrapy.Spider):
     
     def parse_subpage(self, response):
         #check again
-        if request_fingerprint(response.request) in response.meta["fingerprints"]:
+        if url_fingerprint(response.request.url) in response.meta["fingerprints"]:
             return self.processURLstack(response)
         #save the fingerprint to mark the page as read
-        response.meta["fingerprints"].add(request_fingerprint(response.request))
+        response.meta["fingerprints"].add(url_fingerprint(response.request.url))
         
         #try to catch some errors
         try:
@@ -314,10 +324,10 @@ class LinkspiderSpider(scrapy.Spider):
                 if loader.get_collected_values("start_domain")[0] != self.subdomainGetter(response):
                     raise ValueError()
 
-                #extract urls and add them to the urlstack
-                urls = response.xpath("//a/@href").extract() + response.xpath("//frame/@src").extract() + response.xpath("//frameset/@src").extract()
-                for url in urls:
-                    response.meta["urlstack"].append(response.urljoin(url))
+                #extract urls and add them to the urlstack, the domains of new urls are added to the links
+                urls = self.extractURLs(response)
+                urlstack = response.meta["urlstack"]
+                self.collectLinks(loader, response.meta["links"], [url for url in (response.urljoin(url) for url in urls) if urlstack.push(url)])
                         
                 #add info to collector item
                 loader.replace_value("scrape_counter", loader.get_collected_values("scrape_counter")[0]+1)
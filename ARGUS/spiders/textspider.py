@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 import scrapy
-import tldextract
 from ARGUS.items import Collector
+from ARGUS.frontier import URLFrontier
+from ARGUS.middlewares import ArgusOffsiteMiddleware
+from ARGUS.urllist import read_url_chunk
 from scrapy.loader import ItemLoader
-from scrapy.utils.request import request_fingerprint
+from ARGUS.extraction import extract_page, extract_urls
+from ARGUS.urlutils import url_fingerprint, subdomain, registered_domain, cache_snapshot, cache_stats
 import re
+from itertools import chain
 from scrapy.spidermiddlewares.httperror import HttpError
 from twisted.internet.error import DNSLookupError
 from twisted.internet.error import TimeoutError, TCPTimedOutError
-import pandas as pd
 
 class TextspiderSpider(scrapy.Spider):
     name = 'textspider'
@@ -23,17 +26,23 @@ class TextspiderSpider(scrapy.Spider):
 ##################################################################
     
     #load URLs from text file defined in given parameter
-    def __init__(self, url_chunk="", limit=5, ID="ID", url_col="url", language="", prefer_short_urls="on", *args, **kwargs):
+    def __init__(self, url_chunk="", limit=5, ID="ID", url_col="url", language="", prefer_short_urls="on", stream_pages="off", per_site_parallelism=1, *args, **kwargs):
         super(TextspiderSpider, self).__init__(*args, **kwargs)
-        #loads urls and IDs from text file
-        data = pd.read_csv(url_chunk, delimiter="\t", encoding="utf-8", error_bad_lines=False, engine="python")
-        self.allowed_domains = [url.split("www.")[-1].lower() for url in list(data[url_col])]
-        self.start_urls = ["http://" + url.lower() for url in self.allowed_domains]
-        self.IDs = [ID for ID in list(data[ID])]
+        #the url chunk is streamed, start urls and IDs are read lazily in start_requests
+        self.ID_col = ID
+        self.url_col = url_col
+        #set of allowed domains, so that checking a link's domain is O(1)
+        self.allowed_domains = set(domain for ID, domain in read_url_chunk(url_chunk, ID, url_col))
         self.site_limit = int(limit)
         self.url_chunk = url_chunk
         self.language = language.split(",")
         self.prefer_short_urls = prefer_short_urls
+        #max number of subpage requests of one website which are in flight at the same time
+        self.per_site_parallelism = max(int(per_site_parallelism), 1)
+        #counters of the url caches when the crawl starts, the stats only count this crawl
+        self.cache_snapshot = cache_snapshot()
+        #if "on", every page is sent to the pipeline as soon as it is parsed instead of collecting the whole website first
+        self.stream_pages = stream_pages
     
     
 ##################################################################
@@ -51,90 +60,62 @@ class TextspiderSpider(scrapy.Spider):
                 '3gp?download=true', 'asf?download=true', 'asx?download=true', 'avi?download=true', 'mov?download=true', 'mp4?download=true', 'mpg?download=true', 'qt?download=true', 'rm?download=true', 'swf?download=true', 'wmv?download=true', 'm4a?download=true',
                 'css?download=true', 'pdf?download=true', 'doc?download=true', 'exe?download=true', 'bin?download=true', 'rss?download=true', 'zip?download=true', 'rar?download=true', 'msu?download=true', 'flv?download=true', 'dmg?download=true'])
 
-    #function to refresh the allowed domain list after adding domains
-    def refreshAllowedDomains(self):
+    #function to add a domain to the allowed hosts of the offsite middleware
+    #(no rebuild of the allowed domain index, adding is O(1))
+    def refreshAllowedDomains(self, domain):
         for mw in self.crawler.engine.scraper.spidermw.middlewares:
-            if isinstance(mw, scrapy.spidermiddlewares.offsite.OffsiteMiddleware):
-                mw.spider_opened(self)
+            if isinstance(mw, ArgusOffsiteMiddleware):
+                mw.add_domain(domain)
            
     #function which extracts the subdomain from a url string or response object
+    #(resolved hosts are cached and shared by all spiders in the process)
     def subdomainGetter(self, response):
         #if string
         if isinstance(response, str):
-            tld = tldextract.extract(response)
-            if tld.subdomain != "":
-                domain = tld.subdomain + "." + tld.registered_domain
-                return domain
-            else:
-                domain = tld.registered_domain
-                return domain
+            return subdomain(response)
         #if scrapy response object
         else:
-            tld = tldextract.extract(response.url)
-            if tld.subdomain != "":
-                domain = tld.subdomain + "." + tld.registered_domain
-                return domain
-            else:
-                domain = tld.registered_domain
-                return domain
+            return subdomain(response.url)
         
     #function which checks if there has been a redirect from the starting url
     def checkRedirectDomain(self, response):
-        return tldextract.extract(response.url).registered_domain != tldextract.extract(response.request.meta.get("download_slot")).registered_domain
+        return registered_domain(response.url) != registered_domain(response.request.meta.get("download_slot"))
     
-    #function which extracts text using tags
-    def extractText(self, response):
-        text = []
-        text.append(["p", [" ".join(response.xpath("//p/text()").extract())]]) # paragraph
-        text.append(["div", [" ".join(response.xpath("//div/text()").extract())]]) # division
-        text.append(["tr", [" ".join(response.xpath("//tr/text()").extract())]]) # table row
-        text.append(["td", [" ".join(response.xpath("//td/text()").extract())]]) # table data
-        text.append(["th", [" ".join(response.xpath("//th/text()").extract())]]) # table header
-        text.append(["font", [" ".join(response.xpath("//font/text()").extract())]]) # font size, css should be used (only relevant for old websites)
-        text.append(["li", [" ".join(response.xpath("//li/text()").extract())]]) # list item
-        text.append(["small", [" ".join(response.xpath("//small/text()").extract())]]) # barely emphasized text
-        text.append(["strong", [" ".join(response.xpath("//strong/text()").extract())]]) # strongly emphasized text
-        text.append(["h1", [" ".join(response.xpath("//h1/text()").extract())]]) # header
-        text.append(["h2", [" ".join(response.xpath("//h2/text()").extract())]]) # header 
-        text.append(["h3", [" ".join(response.xpath("//h3/text()").extract())]]) # header
-        text.append(["h4", [" ".join(response.xpath("//h4/text()").extract())]]) # header
-        text.append(["h5", [" ".join(response.xpath("//h5/text()").extract())]]) # header
-        text.append(["h6", [" ".join(response.xpath("//h6/text()").extract())]]) # header
-        text.append(["span", [" ".join(response.xpath("//span/text()").extract())]]) # division for styling
-        text.append(["b", [" ".join(response.xpath("//b/text()").extract())]]) # bold text
-        text.append(["em", [" ".join(response.xpath("//em/text()").extract())]]) # emphasized text
-        return text
+    #function which extracts text (per tag), meta information and urls in a single walk over the DOM
+    def extractPage(self, response):
+        return extract_page(response.selector.root)
 
-    #function which extracts and returs meta information
-    def extractHeader(self, response):
-        title = " ".join(response.xpath("//title/text()").extract())
-        description = " ".join(response.xpath("//meta[@name=\'description\']/@content").extract())
-        keywords = " ".join(response.xpath("//meta[@name=\'keywords\']/@content").extract())
-        return title, description, keywords
+    #function which only extracts the urls of links and frames
+    def extractURLs(self, response):
+        return extract_urls(response.selector.root)
 
 
-    #function which reorders the urlstack, giving highest priority to short urls and language tagged urls
-    def reorderUrlstack(self, urlstack, language, prefer_short_urls):
-       preferred_language = []
-       other_language = []
-       language_tags = []
-       if language == "":
-           preferred_language = urlstack
-       else:
-           for ISO in language:
-               language_tags.append("/{}/".format(ISO))
-               language_tags.append("/{}-{}/".format(ISO, ISO))
-               language_tags.append("?lang={}".format(ISO))
-           for url in urlstack:
-               if any(tag in url for tag in language_tags):
-                   preferred_language.append(url)
-               else:
-                   other_language.append(url)
-       if prefer_short_urls == "on":
-           urlstack = sorted(preferred_language, key=len) + sorted(other_language, key=len)
-       else:
-           urlstack = preferred_language + other_language
-       return urlstack
+    #function which adds a scraped page to the website's collector item
+    #in stream mode the page is returned as its own item instead, only the website-level fields stay in the loader
+    def collectPage(self, loader, response, content):
+        title, description, keywords = content.header()
+        if self.stream_pages == "on":
+            page = ItemLoader(item=Collector())
+            for field in ["ID", "dl_slot", "start_page", "redirect", "error"]:
+                page.add_value(field, loader.get_collected_values(field))
+            page.add_value("dl_rank", loader.get_collected_values("scrape_counter")[0] - 1)
+            page.add_value("scraped_urls", [response.urljoin(response.url)])
+            page.add_value("scraped_text", [content.text()])
+            page.add_value("title", [title])
+            page.add_value("description", [description])
+            page.add_value("keywords", [keywords])
+            return [page.load_item()]
+        loader.add_value("scraped_urls", [response.urljoin(response.url)])
+        loader.add_value("scraped_text", [content.text()])
+        loader.add_value("title", [title])
+        loader.add_value("description", [description])
+        loader.add_value("keywords", [keywords])
+        return []
+
+    #function which writes the hit rates of the url caches to the crawl stats when the spider closes
+    def closed(self, reason):
+        for key, value in cache_stats(self.cache_snapshot).items():
+            self.crawler.stats.set_value(key, value)
    
    
 ##################################################################
@@ -143,11 +124,8 @@ class TextspiderSpider(scrapy.Spider):
     
     #start request and add ID to meta
     def start_requests(self):
-        i = -1
-        for url in self.start_urls:
-            i += 1
-            ID = self.IDs[i]
-            yield scrapy.Request(url, callback=self.parse, meta={"ID": ID}, dont_filter=True, errback=self.errorback)
+        for ID, domain in read_url_chunk(self.url_chunk, self.ID_col, self.url_col):
+            yield scrapy.Request("http://" + domain, callback=self.parse, meta={"ID": ID}, dont_filter=True, errback=self.errorback)
   
     #errorback creates an collector item, records the error type, and passes it to the pipeline   
     def errorback(self, failure):
@@ -201,7 +179,8 @@ class TextspiderSpider(scrapy.Spider):
             loader.add_value("title", "")
             loader.add_value("description", "")
             loader.add_value("keywords", "")
-            loader.add_value("error", "other")
+            #pages rejected by ArgusContentFilterMiddleware record the reason ("Content-Type" or "Size")
+            loader.add_value("error", request.meta.get("rejected", "other"))
             loader.add_value("ID", request.meta["ID"])
             yield loader.load_item()
 
@@ -218,38 +197,35 @@ class TextspiderSpider(scrapy.Spider):
         loader.add_value("redirect", self.checkRedirectDomain(response))
         loader.add_value("start_page", response.url)
         loader.add_value("start_domain", self.subdomainGetter(response))  
-        loader.add_value("scraped_urls", [response.urljoin(response.url)])
         loader.add_value("scrape_counter", 1)
-        loader.add_value("scraped_text", [self.extractText(response)])
-        title, description, keywords = self.extractHeader(response)
-        loader.add_value("title", [title])
-        loader.add_value("description", [description])
-        loader.add_value("keywords", [keywords])
         loader.add_value("error", "None")
         loader.add_value("ID", response.request.meta["ID"])
+        content = self.extractPage(response)
+        pages = self.collectPage(loader, response, content)
 
         #initialize the fingerprints set which stores all fingerprints of visited websites
         fingerprints = set()
         #add the fingerprints of the start_page
-        fingerprints.add(request_fingerprint(response.request))
+        fingerprints.add(url_fingerprint(response.request.url))
         
         #if there was an initial redirect, the new domain is added to the allowed domains
         domain = self.subdomainGetter(response)
         if domain not in self.allowed_domains:
-            self.allowed_domains.append(domain)
-            self.refreshAllowedDomains()
+            self.allowed_domains.add(domain)
+            self.refreshAllowedDomains(domain)
 
         #extract all urls from the page...
-        urls = response.xpath("//a/@href").extract() + response.xpath("//frame/@src").extract() + response.xpath("//frameset/@src").extract()
-        #...and safe them to a urlstack
-        urlstack = [response.urljoin(url) for url in urls]
+        urls = content.urls()
+        #...and safe them to a urlstack which keeps the most relevant urls in front
+        urlstack = URLFrontier(self.language, self.prefer_short_urls)
+        urlstack.extend(response.urljoin(url) for url in urls)
             
         #attach the urlstack, the loader, and the fingerprints to the response...        
         response.meta["urlstack"] = urlstack
         response.meta["loader"] = loader
         response.meta["fingerprints"] = fingerprints
-        #...and send it over to the processURLstack function
-        return self.processURLstack(response)
+        #...and send it over to the processURLstack function (after the streamed page, if any)
+        return chain(pages, self.processURLstack(response))
     
     
 ##################################################################
@@ -263,43 +239,71 @@ class TextspiderSpider(scrapy.Spider):
         loader = meta["loader"]
         urlstack = meta["urlstack"]
         fingerprints = meta["fingerprints"]
+        output = []
+
+        #a subpage request came back (response or failure), so it is not in flight anymore
+        #(only once per request, parse_subpage falls back to processURLstack in case of errors)
+        if meta.get("subpage") and not meta.get("counted"):
+            meta["counted"] = True
+            urlstack.in_flight -= 1
         
         #check whether max number of websites has been scraped for this website
         if self.site_limit != 0:
             if loader.get_collected_values("scrape_counter")[0] >= self.site_limit:
-                del urlstack[:]
-        
-        #reorder the urlstack to scrape the most relevant urls first
-        urlstack = self.reorderUrlstack(urlstack, self.language, self.prefer_short_urls)
+                urlstack.clear()
             
-        #check if the next url in the urlstack is valid
-        while len(urlstack) > 0:
-            #pop non-valid domains
-            domain = self.subdomainGetter(urlstack[0])
-            if domain not in self.allowed_domains:
-                urlstack.pop(0)
-            #pop "mailto" urls
-            elif re.match(r"mailto", urlstack[0]):
-                urlstack.pop(0)
-            #pop unwanted filetypes
-            elif urlstack[0].split(".")[-1].lower() in self.filetypes:
-                urlstack.pop(0)
-            #pop visited urls 
-            #(potential bottleneck: Request has to be sent to generate fingerprint from)
-            elif request_fingerprint(scrapy.Request(urlstack[0], callback=None)) in fingerprints:
-                urlstack.pop(0)
-            else:
+        #send out requests until the per-website parallelism is reached
+        #(pages in flight count towards the scrape limit, so that the limit is never exceeded)
+        scrape_counter = loader.get_collected_values("scrape_counter")[0]
+        while urlstack.in_flight < self.per_site_parallelism:
+            if self.site_limit != 0 and scrape_counter + urlstack.in_flight >= self.site_limit:
                 break
 
-        #if the url was assessed to be valid, send out a request and callback the parse_subpage function
-        #errbacks return to processURLstack
-        #ALLOW ALL HTTP STATUS: 
-        #errors must be caught in the callback function, because middleware caught request break the sequence and collector items get lost
-        if len(urlstack) > 0:
-            yield scrapy.Request(urlstack.pop(0), meta={"loader": loader, "urlstack": urlstack, "fingerprints": fingerprints, 'handle_httpstatus_all': True}, dont_filter=True, callback=self.parse_subpage, errback=self.processURLstack)
-        #if there are no urls left in the urlstack, the website was scraped completely and the item can be sent to the pipeline
-        else:
-            yield loader.load_item()
+            #check if the next url in the urlstack is valid
+            while len(urlstack) > 0:
+                url = urlstack.peek()
+                try:
+                    #pop non-valid domains
+                    domain = self.subdomainGetter(url)
+                    if domain not in self.allowed_domains:
+                        urlstack.pop()
+                    #pop "mailto" urls
+                    elif re.match(r"mailto", url):
+                        urlstack.pop()
+                    #pop unwanted filetypes
+                    elif url.split(".")[-1].lower() in self.filetypes:
+                        urlstack.pop()
+                    else:
+                        fingerprint = url_fingerprint(url)
+                        #pop visited or already requested urls
+                        if fingerprint in fingerprints or fingerprint in urlstack.requested:
+                            urlstack.pop()
+                        else:
+                            break
+                #pop urls which cannot be parsed (e.g. "http://www.a.com:abc/")
+                except ValueError:
+                    urlstack.pop()
+            if len(urlstack) == 0:
+                break
+
+            #if the url was assessed to be valid, send out a request and callback the parse_subpage function
+            #errbacks return to processURLstack
+            #ALLOW ALL HTTP STATUS: 
+            #errors must be caught in the callback function, because middleware caught request break the sequence and collector items get lost
+            url = urlstack.pop()
+            try:
+                request = scrapy.Request(url, meta={"loader": loader, "urlstack": urlstack, "fingerprints": fingerprints, "subpage": True, 'handle_httpstatus_all': True}, dont_filter=True, callback=self.parse_subpage, errback=self.processURLstack)
+            except ValueError:
+                continue
+            urlstack.requested.add(fingerprint)
+            urlstack.in_flight += 1
+            output.append(request)
+
+        #if there are no urls left in the urlstack and no request is in flight, the website was scraped completely and the item can be sent to the pipeline
+        #(in stream mode the item only carries the website-level fields and marks the website as finished)
+        if urlstack.in_flight == 0:
+            output.append(loader.load_item())
+        return output
     
     
 ##################################################################
@@ -308,11 +312,11 @@ class TextspiderSpider(scrapy.Spider):
     
     def parse_subpage(self, response):
         #check again
-        if request_fingerprint(response.request) in response.meta["fingerprints"]:
+        if url_fingerprint(response.request.url) in response.meta["fingerprints"]:
             return self.processURLstack(response)
         
         #save the fingerprint to mark the page as read
-        response.meta["fingerprints"].add(request_fingerprint(response.request))
+        response.meta["fingerprints"].add(url_fingerprint(response.request.url))
         
 
         #try to catch some errors
@@ -337,9 +341,9 @@ class TextspiderSpider(scrapy.Spider):
                     raise ValueError()
 
                 #extract urls and add them to the urlstack
-                urls = response.xpath("//a/@href").extract() + response.xpath("//frame/@src").extract() + response.xpath("//frameset/@src").extract()
+                urls = self.extractURLs(response)
                 for url in urls:
-                    response.meta["urlstack"].append(response.urljoin(url))
+                    response.meta["urlstack"].push(response.urljoin(url))
 
                 #pass back the updated urlstack    
                 return self.processURLstack(response)
@@ -354,9 +358,9 @@ class TextspiderSpider(scrapy.Spider):
                     raise ValueError()
 
                 #extract urls and add them to the urlstack
-                urls = response.xpath("//a/@href").extract() + response.xpath("//frame/@src").extract() + response.xpath("//frameset/@src").extract()
+                urls = self.extractURLs(response)
                 for url in urls:
-                    response.meta["urlstack"].append(response.urljoin(url))
+                    response.meta["urlstack"].push(response.urljoin(url))
                                         
                 #pass back the updated urlstack    
                 return self.processURLstack(response)
@@ -372,21 +376,16 @@ class TextspiderSpider(scrapy.Spider):
                     raise ValueError()
 
                 #extract urls and add them to the urlstack
-                urls = response.xpath("//a/@href").extract() + response.xpath("//frame/@src").extract() + response.xpath("//frameset/@src").extract()
-                for url in urls:
-                    response.meta["urlstack"].append(response.urljoin(url))
+                content = self.extractPage(response)
+                for url in content.urls():
+                    response.meta["urlstack"].push(response.urljoin(url))
     
                 #add info to collector item
                 loader.replace_value("scrape_counter", loader.get_collected_values("scrape_counter")[0]+1)
-                loader.add_value("scraped_urls", [response.urljoin(response.url)])
-                loader.add_value("scraped_text", [self.extractText(response)])
-                title, description, keywords = self.extractHeader(response)
-                loader.add_value("title", [title])
-                loader.add_value("description", [description])
-                loader.add_value("keywords", [keywords])
+                pages = self.collectPage(loader, response, content)
             
                 #pass back the updated urlstack
-                return self.processURLstack(response)
+                return chain(pages, self.processURLstack(response))
             
         #in case of errors, opt out and fall back to processURLstack
         except:
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+# Streaming reader of the url chunks.
+#
+# The spiders read their url chunk row by row with the csv module and keep
+# only the ID and url columns, instead of parsing the whole chunk into a
+# DataFrame and copying it into lists. start_requests reads the chunk again
+# lazily, so the start urls are never held in memory all at once.
+# IDs are kept as the strings of the file (e.g. leading zeros are kept).
+
+import csv
+
+
+#function which returns the start domain of a url from the url list (without "www.", lowercase)
+def start_domain(url):
+    return url.split("www.")[-1].lower()
+
+
+#function which yields (ID, start domain) for every row of a url chunk written by start_crawl
+#rows with too many or too few fields are skipped
+def read_url_chunk(url_chunk, ID="ID", url_col="url"):
+    with open(url_chunk, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, None)
+        if header is None:
+            return
+        id_index = header.index(ID)
+        url_index = header.index(url_col)
+        n_fields = len(header)
+        for row in reader:
+            if len(row) != n_fields:
+                continue
+            yield row[id_index], start_domain(row[url_index])
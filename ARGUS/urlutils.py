@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# URL helpers shared by the spiders.
+
+import hashlib
+import re
+from functools import lru_cache
+from urllib.parse import scheme_chars
+import tldextract
+from w3lib.url import canonicalize_url, safe_url_string
+try:
+    from scrapy.utils.url import escape_ajax
+except ImportError:
+    #newer scrapy versions no longer rewrite ajax urls in Request
+    escape_ajax = None
+
+
+#function which returns the fingerprint of a url
+#gives the same "visited" decisions as request_fingerprint(scrapy.Request(url)) for GET requests,
+#but without allocating a Request object: the url is made safe and ajax-escaped like in Request,
+#then canonicalized (scheme/host lowercased, query sorted, fragment stripped) and hashed
+#urls repeat a lot within a website (menus, footers), so results are cached
+@lru_cache(maxsize=100000)
+def url_fingerprint(url):
+    url = safe_url_string(url)
+    if escape_ajax is not None and "#!" in url:
+        url = escape_ajax(url)
+    return hashlib.sha1(canonicalize_url(url).encode("utf-8")).digest()
+
+
+SCHEME_RE = re.compile(r"^([" + scheme_chars + r"]+:)?//")
+
+#function which extracts the host from a url string the same lenient way tldextract does
+def url_host(url):
+    netloc = SCHEME_RE.sub("", url).partition("/")[0].partition("?")[0].partition("#")[0]
+    return netloc.split("@")[-1].partition(":")[0].strip().rstrip(".")
+
+#function which resolves a host to (subdomain, registered domain)
+#tldextract is slow compared to the per-link checks, hosts repeat for every link of a website
+@lru_cache(maxsize=100000)
+def resolve_host(host):
+    tld = tldextract.extract(host)
+    return tld.subdomain, tld.registered_domain
+
+#function which returns the full domain incl. subdomain of a url, e.g. "www.example.com"
+def subdomain(url):
+    sub, domain = resolve_host(url_host(url))
+    if sub != "":
+        return sub + "." + domain
+    return domain
+
+#function which returns the registered domain of a url, e.g. "example.com"
+def registered_domain(url):
+    return resolve_host(url_host(url))[1]
+
+#function which returns the hit/miss counters of the url caches since a snapshot taken by cache_snapshot
+#(the caches live as long as the process, which can run several crawls one after another, e.g. in run_local)
+def cache_stats(snapshot=None):
+    stats = {}
+    for name, cache in [("domain_cache", resolve_host), ("fingerprint_cache", url_fingerprint)]:
+        info = cache.cache_info()
+        hits, misses = (snapshot or {}).get(name, (0, 0))
+        hits, misses = info.hits - hits, info.misses - misses
+        stats["argus/{}/hits".format(name)] = hits
+        stats["argus/{}/misses".format(name)] = misses
+        if hits + misses > 0:
+            stats["argus/{}/hit_rate".format(name)] = round(hits / (hits + misses), 4)
+    return stats
+
+#function which returns the current hit/miss counters of the url caches
+def cache_snapshot():
+    return {name: (cache.cache_info().hits, cache.cache_info().misses) for name, cache in [("domain_cache", resolve_host), ("fingerprint_cache", url_fingerprint)]}
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the website aggregation.
+
+Generates a webpage-level text spider output file of the given size and
+aggregates it with one process and with the given number of worker
+processes, and checks that both outputs are identical.
+
+usage: python benchmarks/bench_aggregator.py [size_in_GB] [workers]
+defaults: 10 GB and the number of CPUs
+"""
+
+import filecmp
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bin.aggregator import aggregate_webpages
+
+
+#writes webpage-level rows of websites with 1 to 20 webpages until the file has the given size
+def generate(fn, size, seed=0):
+    rnd = random.Random(seed)
+    words = ["Maschinenbau", "Innovation", "Produkte", "Service", "Kontakt", "GmbH", "Qualität", "Team", "Karriere"]
+    texts = [" ".join(rnd.choice(words) for _ in range(rnd.randint(20, 800))) for _ in range(100)]
+    with open(fn, "w", encoding="utf-8", newline="") as f:
+        f.write("ID\tdl_rank\tdl_slot\terror\tredirect\tstart_page\ttitle\tkeywords\tdescription\ttext\ttimestamp\turl\r\n")
+        website = 0
+        while f.tell() < size:
+            rows = []
+            for dl_rank in range(rnd.randint(1, 20)):
+                rows.append("{0}\t{1}\tfirm{0}.de\tNone\tFalse\thttp://www.firm{0}.de\tFirm {0}\tkeywords\tdescription\t{2}\tMon Jan  1 00:00:00 2024\thttp://www.firm{0}.de/{1}\r\n"
+                            .format(website, dl_rank, rnd.choice(texts)))
+            f.write("".join(rows))
+            website += 1
+    return website
+
+
+def main():
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    directory = tempfile.mkdtemp()
+    try:
+        fn = os.path.join(directory, "bench_scraped_texts.csv")
+        websites = generate(fn, int(size * 1e9))
+        print("{:.1f} GB, {} websites".format(os.path.getsize(fn) / 1e9, websites))
+
+        t = time.perf_counter()
+        single = aggregate_webpages(fn, 1)
+        elapsed = time.perf_counter() - t
+        print("1 process:    {:8.1f} sec {:8.1f} MB/sec".format(elapsed, os.path.getsize(fn) / elapsed / 1e6))
+        os.replace(single, single + ".single")
+
+        t = time.perf_counter()
+        parallel = aggregate_webpages(fn, workers)
+        elapsed = time.perf_counter() - t
+        print("{} processes: {:8.1f} sec {:8.1f} MB/sec".format(workers, elapsed, os.path.getsize(fn) / elapsed / 1e6))
+        print("identical output: {}".format(filecmp.cmp(single + ".single", parallel, shallow=False)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
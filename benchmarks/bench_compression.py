@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of compressed page transfer.
+
+Starts a local fixture HTTP server which serves saved HTML pages with the
+requested Content-Encoding (compressed once up front, like a web server with
+precompressed or cached responses) and fetches every page once per encoding
+over a keep-alive connection. The pages are decompressed with the decoders of
+ArgusHttpCompressionMiddleware and compared with the originals.
+
+Reports the bytes on the wire, the compression ratio, the wall time and the
+CPU time spent on decompression per page. The server can throttle its
+bandwidth to simulate a slow link, where the smaller transfers pay off most.
+The CPU time a server needs to compress a page on the fly is shown for
+reference.
+
+usage: python benchmarks/bench_compression.py [html_dir] [requests] [mbit_per_sec]
+html_dir defaults to benchmarks/fixtures, every *.html/*.htm file is used,
+mbit_per_sec 0 (default) means no throttling.
+"""
+
+import gzip
+import http.client
+import os
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ARGUS.middlewares import DECODERS, brotli, decode_body, zstandard
+
+COMPRESSORS = {b"gzip": lambda body: gzip.compress(body, 6), b"deflate": lambda body: zlib.compress(body, 6)}
+if brotli is not None:
+    COMPRESSORS[b"br"] = lambda body: brotli.compress(body, quality=5)
+if zstandard is not None:
+    COMPRESSORS[b"zstd"] = lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+
+
+def load_pages(html_dir):
+    pages = {}
+    for fn in sorted(os.listdir(html_dir)):
+        if fn.split(".")[-1].lower() not in ("html", "htm"):
+            continue
+        with open(os.path.join(html_dir, fn), "rb") as f:
+            pages["/" + fn] = f.read()
+    return pages
+
+
+#returns the server, the encoded pages (encoding -> path -> body) and the compression time per encoding
+def start_server(pages, bytes_per_sec):
+    encoded = {b"identity": dict(pages)}
+    compress_time = {b"identity": 0.0}
+    for encoding, compress in COMPRESSORS.items():
+        t = time.process_time()
+        encoded[encoding] = {path: compress(body) for path, body in pages.items()}
+        compress_time[encoding] = time.process_time() - t
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        #headers and body are written separately, without this every response waits for a delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            encoding = self.headers.get("Accept-Encoding", "identity").split(",")[0].strip().encode()
+            body = encoded.get(encoding, encoded[b"identity"]).get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if encoding in COMPRESSORS:
+                self.send_header("Content-Encoding", encoding.decode())
+            self.end_headers()
+            if bytes_per_sec:
+                #send in 16 KB pieces at the given bandwidth
+                for i in range(0, len(body), 16384):
+                    self.wfile.write(body[i:i+16384])
+                    time.sleep(len(body[i:i+16384]) / bytes_per_sec)
+            else:
+                self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, compress_time
+
+
+def fetch_all(port, paths, encoding, pages):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    wire_bytes = 0
+    decode_time = 0.0
+    mismatches = 0
+    t = time.perf_counter()
+    for path in paths:
+        connection.request("GET", path, headers={"Accept-Encoding": encoding.decode()})
+        response = connection.getresponse()
+        body = response.read()
+        wire_bytes += len(body)
+        content_encoding = (response.getheader("Content-Encoding") or "identity").encode()
+        if content_encoding in DECODERS:
+            started = time.process_time()
+            body = decode_body(body, DECODERS[content_encoding], 0)
+            decode_time += time.process_time() - started
+        if body != pages[path]:
+            mismatches += 1
+    wall_time = time.perf_counter() - t
+    connection.close()
+    return wire_bytes, wall_time, decode_time, mismatches
+
+
+def main():
+    html_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    mbit_per_sec = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    pages = load_pages(html_dir)
+    if not pages:
+        print("No HTML files found in", html_dir)
+        return
+    paths = [sorted(pages)[i % len(pages)] for i in range(n_requests)]
+    server, compress_time = start_server(pages, mbit_per_sec * 125000)
+    port = server.server_address[1]
+
+    print("pages: {} files, {} requests, bandwidth: {}".format(len(pages), n_requests, "{} Mbit/s".format(mbit_per_sec) if mbit_per_sec else "unthrottled"))
+    print("{:<9} {:>10} {:>7} {:>9} {:>10} {:>12} {:>14}".format("encoding", "wire MB", "ratio", "wall s", "pages/s", "decode ms/p", "compress ms/p"))
+    identity_bytes = None
+    for encoding in [b"identity"] + list(COMPRESSORS):
+        wire_bytes, wall_time, decode_time, mismatches = fetch_all(port, paths, encoding, pages)
+        if identity_bytes is None:
+            identity_bytes = wire_bytes
+        print("{:<9} {:>10.3f} {:>6.1f}x {:>9.2f} {:>10.1f} {:>12.3f} {:>14.3f}{}".format(
+            encoding.decode(), wire_bytes / 1e6, identity_bytes / wire_bytes, wall_time, n_requests / wall_time,
+            1000 * decode_time / n_requests, 1000 * compress_time[encoding] / len(pages),
+            "" if not mismatches else "  ({} pages differ!)".format(mismatches)))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the page content extraction of the text spider.
+
+Compares the old per-tag XPath extraction (18 text queries, 3 header queries
+and 3 link queries per page) with the single DOM walk in ARGUS.extraction
+over a corpus of saved HTML pages and checks that both give identical output.
+
+usage: python benchmarks/bench_extraction.py [html_dir] [repetitions]
+html_dir defaults to benchmarks/fixtures, every *.html/*.htm file is used.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scrapy.http import HtmlResponse
+from ARGUS.extraction import extract_page, extract_urls, TEXT_TAGS
+
+
+def old_extract(response):
+    text = []
+    for tag in TEXT_TAGS:
+        text.append([tag, [" ".join(response.xpath("//{}/text()".format(tag)).extract())]])
+    title = " ".join(response.xpath("//title/text()").extract())
+    description = " ".join(response.xpath("//meta[@name=\'description\']/@content").extract())
+    keywords = " ".join(response.xpath("//meta[@name=\'keywords\']/@content").extract())
+    urls = response.xpath("//a/@href").extract() + response.xpath("//frame/@src").extract() + response.xpath("//frameset/@src").extract()
+    return text, (title, description, keywords), urls
+
+
+def new_extract(response):
+    content = extract_page(response.selector.root)
+    return content.text(), content.header(), content.urls()
+
+
+def load_corpus(html_dir):
+    responses = []
+    for fn in sorted(os.listdir(html_dir)):
+        if fn.split(".")[-1].lower() not in ("html", "htm"):
+            continue
+        with open(os.path.join(html_dir, fn), "rb") as f:
+            body = f.read()
+        response = HtmlResponse(url="http://www.example.com/" + fn, body=body, encoding="utf-8")
+        #parse the DOM up front, both variants work on the same parsed tree
+        response.selector
+        responses.append(response)
+    return responses
+
+
+def bench(func, responses, repetitions):
+    t = time.perf_counter()
+    for _ in range(repetitions):
+        for response in responses:
+            func(response)
+    return len(responses) * repetitions / (time.perf_counter() - t)
+
+
+def main():
+    html_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    responses = load_corpus(html_dir)
+    if not responses:
+        print("No HTML files found in", html_dir)
+        return
+
+    mismatches = [r.url for r in responses if old_extract(r) != new_extract(r) or old_extract(r)[2] != extract_urls(r.selector.root)]
+    old_rate = bench(old_extract, responses, repetitions)
+    new_rate = bench(new_extract, responses, repetitions)
+
+    print("pages: {} x {} repetitions".format(len(responses), repetitions))
+    print("per-tag XPath:   {:10.1f} pages/sec".format(old_rate))
+    print("single DOM walk: {:10.1f} pages/sec".format(new_rate))
+    print("speedup:         {:10.1f}x".format(new_rate / old_rate))
+    print("identical output: {}".format("yes" if not mismatches else "NO, differs for " + ", ".join(mismatches)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the link spider postprocessing.
+
+Generates synthetic link spider output chunks and classifies the links into
+internal and external links with the old list-based procedure and with
+postprocessing.classify_links (in-memory set and on-disk sqlite index).
+The old procedure is quadratic in the number of firms, so it only runs on
+the small dataset, where the outputs are also compared.
+
+usage: python benchmarks/bench_links.py [n_firms] [n_links] [small_n_firms] [small_n_links]
+defaults: 1000000 firms with 20000000 links, and 20000 firms with 400000 links
+"""
+
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bin.postprocessing import classify_links, DiskDomainIndex
+from ARGUS.compression import open_output_file
+
+
+def old_classify_links(output_files, merged_file):
+    all_internal_links = []
+    for fn in output_files:
+        f = open_output_file(fn)
+        f.readline()
+        while 1:
+            line = f.readline()
+            if not line:
+                break
+            dl_slot = line.split("\t")[2]
+            if dl_slot not in all_internal_links:
+                all_internal_links.append(dl_slot)
+        f.close()
+    c = 0
+    for fn in output_files:
+        f = open_output_file(fn)
+        if c == 0:
+            line = f.readline().split("\t")
+            merged_file.write(line[0] + "\t" + line[1] + "\t" + line[2] + "\t" + line[3] + "\t" + "links_internal" + "\t" + "links_external" + "\t" + line[5] + "\t"  + line[6] + "\t" + line[7])
+            c += 1
+        else:
+            f.readline()
+        while 1:
+            line = f.readline()
+            if not line:
+                break
+            line = line.split("\t")
+            links_internal = [line[2]]
+            links_external = [line[2]]
+            for link in line[4].split(","):
+                if link == "":
+                    continue
+                if link in all_internal_links:
+                    if link not in links_internal:
+                        links_internal.append(link)
+                else:
+                    links_external.append(link)
+            links_internal = ",".join(links_internal) if len(links_internal) > 1 else ""
+            links_external = ",".join(links_external) if len(links_external) > 1 else ""
+            merged_file.write(line[0] + "\t" + line[1] + "\t" + line[2] + "\t" + line[3] + "\t" + links_internal + "\t" + links_external + "\t" + line[5] + "\t"  + line[6] + "\t" + line[7])
+        f.close()
+
+
+#writes link spider output chunks, 40 % of the links point to other firms of the population
+def generate(directory, n_firms, n_links, n_chunks=100, seed=0):
+    rnd = random.Random(seed)
+    files = []
+    firms_per_chunk = -(-n_firms // n_chunks)
+    links_per_firm = n_links / n_firms
+    for chunk in range(n_chunks):
+        fn = os.path.join(directory, "output_p{}.csv".format(chunk + 1))
+        with open(fn, "w", encoding="utf-8", newline="") as f:
+            f.write("ID\talias\tdl_slot\terror\tlinks\tredirect\ttimestamp\turl\r\n")
+            for firm in range(chunk * firms_per_chunk, min((chunk + 1) * firms_per_chunk, n_firms)):
+                links = []
+                for _ in range(int(links_per_firm * 2 * rnd.random() + 0.5)):
+                    if rnd.random() < 0.4:
+                        links.append("firm{}.de".format(rnd.randrange(n_firms)))
+                    else:
+                        links.append("external{}.com".format(rnd.randrange(n_firms * 5)))
+                f.write("{0}\tfirm{0}\tfirm{0}.de\tNone\t{1}\tFalse\tMon Jan  1 00:00:00 2024\thttp://www.firm{0}.de\r\n".format(firm, ",".join(links)))
+        files.append(fn)
+    return files
+
+
+def run(name, func, output):
+    t = time.perf_counter()
+    #the progress messages are not shown
+    with open(output, "w", encoding="utf-8") as merged_file, contextlib.redirect_stdout(io.StringIO()):
+        func(merged_file)
+    elapsed = time.perf_counter() - t
+    print("  {:28s} {:8.1f} sec".format(name, elapsed))
+    return elapsed
+
+
+def bench(n_firms, n_links, with_old):
+    directory = tempfile.mkdtemp()
+    try:
+        print("{} firms, {} links:".format(n_firms, n_links))
+        files = generate(directory, n_firms, n_links)
+        new_output = os.path.join(directory, "new.csv")
+        run("set index", lambda merged_file: classify_links(files, merged_file, set()), new_output)
+        disk_index = DiskDomainIndex(os.path.join(directory, "index"))
+        run("on-disk index", lambda merged_file: classify_links(files, merged_file, disk_index), os.path.join(directory, "disk.csv"))
+        disk_index.close()
+        with open(new_output, "rb") as f1, open(os.path.join(directory, "disk.csv"), "rb") as f2:
+            print("  identical output (set/on-disk): {}".format(f1.read() == f2.read()))
+        if with_old:
+            old_output = os.path.join(directory, "old.csv")
+            run("old list-based procedure", lambda merged_file: old_classify_links(files, merged_file), old_output)
+            with open(new_output, "rb") as f1, open(old_output, "rb") as f2:
+                print("  identical output (old/new): {}".format(f1.read() == f2.read()))
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    n_firms = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    n_links = int(sys.argv[2]) if len(sys.argv) > 2 else 20000000
+    small_n_firms = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    small_n_links = int(sys.argv[4]) if len(sys.argv) > 4 else 400000
+    bench(small_n_firms, small_n_links, True)
+    bench(n_firms, n_links, False)
+
+
+if __name__ == "__main__":
+    main()
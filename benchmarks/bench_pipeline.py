@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the text pipeline.
+
+Replays Collector items through the old TextPipeline (string concatenation,
+replace chains, one strftime per row and CsvItemExporter writes per item)
+and the current TextPipeline, and reports rows/sec and bytes/sec. The
+outputs are compared apart from the timestamp column.
+
+usage: python benchmarks/bench_pipeline.py [n_websites] [items.pkl]
+items.pkl is an optional pickled list of recorded Collector items (or dicts
+with the same fields); without it synthetic websites are generated.
+"""
+
+import csv
+import datetime
+import logging
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scrapy.exporters import CsvItemExporter
+from ARGUS.items import Collector, Exporter
+from ARGUS.extraction import TEXT_TAGS
+from ARGUS.pipelines import TextPipeline
+
+
+class OldTextPipeline(TextPipeline):
+
+    def open_spider(self, spider):
+        chunk = spider.url_chunk.split(".")[0].split("_")[-1]
+        self.fileobj = open(os.path.join(os.getcwd(), "chunks", "output_" + chunk + ".csv"), "wb")
+        self.exporter = CsvItemExporter(self.fileobj, encoding='utf-8', delimiter="\t")
+        self.exporter.fields_to_export = ["ID", "dl_rank", "dl_slot", "error", "redirect", "start_page", "title", "keywords", "description", "text", "timestamp", "url"]
+        self.exporter.start_exporting()
+        self.outputs = [(self.fileobj.name, 0, self.fileobj, self.exporter)]
+
+    def close_spider(self, spider):
+        self.exporter.finish_exporting()
+        self.fileobj.close()
+
+    def process_item(self, item, spider):
+        scraped_text = item["scraped_text"]
+        c=0
+        for sitechunk in scraped_text:
+            site = Exporter()
+            site["dl_slot"] = item["dl_slot"][0]
+            site["start_page"] = item["start_page"][0]
+            site["url"] = item["scraped_urls"][c]
+            site["redirect"] = item["redirect"][0]
+            site["error"] = item["error"]
+            site["ID"] = item["ID"][0]
+            title = item["title"][c]
+            description = item["description"][c]
+            keywords = item["keywords"][c]
+            site["title"] = title.replace("\n", "").replace("\t", "").replace("\r\n", "").replace("\r", "")
+            site["description"] = description.replace("\n", "").replace("\t", "").replace("\r\n", "").replace("\r", "")
+            site["keywords"] = keywords.replace("\n", "").replace("\t", "").replace("\r\n", "").replace("\r", "")
+            site_text = ""
+            for tagchunk in sitechunk:
+                text_piece = tagchunk[-1]
+                text_piece = " ".join(text_piece[0].split())
+                text_piece = text_piece.replace("\n", "").replace("\t", "").replace("\r\n", "").replace("\r", "")
+                if text_piece.strip().strip('"') == "":
+                    continue
+                site_text = site_text + text_piece
+            site["text"] = site_text
+            site["timestamp"] = datetime.datetime.fromtimestamp(time.time()).strftime("%c")
+            site["dl_rank"] = c
+            self.exporter.export_item(site)
+            c+=1
+        return
+
+
+class BenchSpider(object):
+    url_chunk = "url_chunk_bench.csv"
+    logger = logging.getLogger("bench")
+
+
+def synthetic_items(n_websites, pages=10, seed=0):
+    rnd = random.Random(seed)
+    words = ["Maschinenbau", "Innovation", "Produkte", "Service", "Kontakt", "GmbH", "Qualität", "\"zitiert\"", "Team", "Karriere"]
+    items = []
+    for i in range(n_websites):
+        item = Collector()
+        item["ID"] = [i]
+        item["dl_slot"] = ["example{}.com".format(i)]
+        item["start_page"] = ["http://www.example{}.com/".format(i)]
+        item["redirect"] = [False]
+        item["error"] = ["None"]
+        item["scraped_urls"] = ["http://www.example{}.com/p{}".format(i, p) for p in range(pages)]
+        item["title"] = ["Title\n{} page {}\t".format(i, p) for p in range(pages)]
+        item["description"] = ["Description of\r\nexample {}".format(i) for p in range(pages)]
+        item["keywords"] = ["a, b,\tc" for p in range(pages)]
+        item["scraped_text"] = [[[tag, [" ".join(rnd.choice(words) for _ in range(rnd.randint(0, 60))) + "\n\t "]] for tag in TEXT_TAGS] for p in range(pages)]
+        items.append(item)
+    return items
+
+
+def run(pipeline, items):
+    pipeline.open_spider(BenchSpider())
+    t = time.perf_counter()
+    for item in items:
+        pipeline.process_item(item, BenchSpider())
+    pipeline.close_spider(BenchSpider())
+    return time.perf_counter() - t, pipeline.outputs[0][0]
+
+
+def read_rows(fn):
+    with open(fn, encoding="utf-8", newline="") as f:
+        #timestamps differ between the runs
+        return [row[:10] + row[11:] for row in csv.reader(f, delimiter="\t")]
+
+
+def main():
+    n_websites = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "rb") as f:
+            items = pickle.load(f)
+    else:
+        items = synthetic_items(n_websites)
+
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)
+    os.mkdir("chunks")
+    try:
+        results = {}
+        for name, pipeline in [("old", OldTextPipeline()), ("new", TextPipeline())]:
+            elapsed, fn = run(pipeline, items)
+            new_fn = os.path.join(tmp, name + ".csv")
+            os.replace(fn, new_fn)
+            results[name] = (elapsed, new_fn)
+        rows = len(read_rows(results["new"][1])) - 1
+        size = os.path.getsize(results["new"][1])
+        for name in ["old", "new"]:
+            elapsed = results[name][0]
+            print("{} TextPipeline: {:10.0f} rows/sec {:8.1f} MB/sec".format(name, rows / elapsed, size / elapsed / 1e6))
+        print("speedup: {:.1f}x".format(results["old"][0] / results["new"][0]))
+        print("identical output (except timestamps): {}".format(read_rows(results["old"][1]) == read_rows(results["new"][1])))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the urlstack processing in processURLstack.
+
+Compares the old loop (list urlstack re-sorted on every page, discards with
+pop(0), fingerprints via scrapy.Request + request_fingerprint) with the
+URLFrontier + url_fingerprint path on a synthetic page with 5,000 links.
+Every simulated page re-adds the page's links (menus, footers), as on real
+websites, until the page limit is reached.
+
+usage: python benchmarks/bench_urlstack.py [n_links] [limit]
+"""
+
+import os
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import scrapy
+from ARGUS.frontier import URLFrontier
+from ARGUS.urlutils import url_fingerprint
+try:
+    from scrapy.utils.request import request_fingerprint
+except ImportError:
+    from scrapy.utils.request import fingerprint as request_fingerprint
+
+
+FILETYPES = set(["pdf", "jpg", "png", "zip", "doc", "css"])
+ALLOWED = set(["www.example.com"])
+
+
+def synthetic_page(n_links, seed=0):
+    rnd = random.Random(seed)
+    urls = []
+    for i in range(n_links):
+        r = rnd.random()
+        page = "/".join("p{}".format(rnd.randint(0, n_links // 4)) for _ in range(rnd.randint(1, 4)))
+        if r < 0.05:
+            urls.append("mailto:info@example.com")
+        elif r < 0.15:
+            urls.append("http://www.other{}.com/{}".format(rnd.randint(0, 50), page))
+        elif r < 0.20:
+            urls.append("http://www.example.com/{}.{}".format(page, rnd.choice(list(FILETYPES))))
+        elif r < 0.30:
+            urls.append("http://www.example.com/de/{}".format(page))
+        elif r < 0.40:
+            urls.append("http://www.example.com/{}#section{}".format(page, rnd.randint(0, 3)))
+        else:
+            urls.append("http://www.example.com/{}".format(page))
+    return urls
+
+
+def domain(url):
+    return urlsplit(url).hostname or ""
+
+
+def reorder(urlstack, language):
+    language_tags = []
+    for ISO in language:
+        language_tags.append("/{}/".format(ISO))
+        language_tags.append("/{}-{}/".format(ISO, ISO))
+        language_tags.append("?lang={}".format(ISO))
+    preferred_language = []
+    other_language = []
+    for url in urlstack:
+        if any(tag in url for tag in language_tags):
+            preferred_language.append(url)
+        else:
+            other_language.append(url)
+    return sorted(preferred_language, key=len) + sorted(other_language, key=len)
+
+
+def run_old(links, limit, language):
+    urlstack = list(links)
+    fingerprints = set()
+    scraped = []
+    while len(scraped) < limit:
+        urlstack = reorder(urlstack, language)
+        while len(urlstack) > 0:
+            if domain(urlstack[0]) not in ALLOWED:
+                urlstack.pop(0)
+            elif urlstack[0].startswith("mailto"):
+                urlstack.pop(0)
+            elif urlstack[0].split(".")[-1].lower() in FILETYPES:
+                urlstack.pop(0)
+            elif request_fingerprint(scrapy.Request(urlstack[0], callback=None)) in fingerprints:
+                urlstack.pop(0)
+            else:
+                break
+        if len(urlstack) == 0:
+            break
+        url = urlstack.pop(0)
+        fingerprints.add(request_fingerprint(scrapy.Request(url, callback=None)))
+        scraped.append(url)
+        urlstack.extend(links)
+    return scraped
+
+
+def run_new(links, limit, language):
+    url_fingerprint.cache_clear()
+    urlstack = URLFrontier(language, "on")
+    urlstack.extend(links)
+    fingerprints = set()
+    scraped = []
+    while len(scraped) < limit:
+        while len(urlstack) > 0:
+            url = urlstack.peek()
+            if domain(url) not in ALLOWED:
+                urlstack.pop()
+            elif url.startswith("mailto"):
+                urlstack.pop()
+            elif url.split(".")[-1].lower() in FILETYPES:
+                urlstack.pop()
+            elif url_fingerprint(url) in fingerprints:
+                urlstack.pop()
+            else:
+                break
+        if len(urlstack) == 0:
+            break
+        url = urlstack.pop()
+        fingerprints.add(url_fingerprint(url))
+        scraped.append(url)
+        urlstack.extend(links)
+    return scraped
+
+
+def main():
+    n_links = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    language = ["de", "deu", "ger"]
+    links = synthetic_page(n_links)
+
+    t = time.perf_counter()
+    old = run_old(links, limit, language)
+    t_old = time.perf_counter() - t
+
+    t = time.perf_counter()
+    new = run_new(links, limit, language)
+    t_new = time.perf_counter() - t
+
+    print("links per page: {}, page limit: {}".format(n_links, limit))
+    print("old urlstack loop: {:.3f} s".format(t_old))
+    print("URLFrontier loop:  {:.3f} s".format(t_new))
+    print("speedup:           {:.1f}x".format(t_old / t_new))
+    #fragment variants of a visited page are dropped by both, so the scraped pages have to match
+    print("same pages scraped: {}".format(old == new))
+
+
+if __name__ == "__main__":
+    main()
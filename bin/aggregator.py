@@ -5,73 +5,159 @@ Created on Mon Nov 12 09:01:19 2018
 @author: JKI
 """
 
-import pandas as pd
+import argparse
+import csv
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from ARGUS.compression import is_compressed, open_output_file
+from ARGUS.exporters import BUFFER_SIZE
 
-def aggregate_webpages(filepath=None):
+#columns of the aggregated output
+AGGREGATED_FIELDS = ["ID", "dl_rank", "dl_slot", "error", "redirect", "start_page", "title", "keywords", "description", "text", "timestamp"]
+
+#webpage texts can be longer than the default field size limit of the csv module
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+
+#function which formats a row like csv.writer(delimiter="\t", lineterminator="\n") does (also quoting "\r"),
+#but much faster for long text fields
+def format_row(row):
+    return "\t".join('"' + value.replace('"', '""') + '"' if ('"' in value or "\t" in value or "\n" in value or "\r" in value) else value
+                     for value in row) + "\n"
+
+
+#function which aggregates webpage-level rows to website-level rows
+#rows of a website have to be contiguous; a website row holds the fields of its first webpage, the dl_rank
+#of its last webpage, and the texts of all webpages; rows are yielded as soon as the next website starts
+def aggregate_rows(rows, columns):
+    text_col = columns["text"]
+    dl_slot_col = columns["dl_slot"]
+    dl_rank_col = columns["dl_rank"]
+    first = None
+    texts = []
+    for row in rows:
+        if first is not None and row[dl_slot_col] != first[dl_slot_col]:
+            yield [first[columns[field]] for field in AGGREGATED_FIELDS[:9]] + ["".join(texts), first[columns["timestamp"]]]
+            first = None
+        if first is None:
+            first = row
+            texts = []
+        first[dl_rank_col] = row[dl_rank_col]
+        texts.append(row[text_col])
+    if first is not None:
+        yield [first[columns[field]] for field in AGGREGATED_FIELDS[:9]] + ["".join(texts), first[columns["timestamp"]]]
+
+
+#function which reads webpage-level rows, skipping (and counting) rows with a wrong number of fields
+def read_rows(reader, n_fields, skipped):
+    for row in reader:
+        if len(row) != n_fields:
+            skipped[0] += 1
+            continue
+        yield row
+
+
+#function which splits the data rows of an uncompressed file into up to n byte ranges (start, end)
+#which all begin at a website boundary, so that every range can be aggregated independently
+def plan_shards(filename, n, dl_slot_col):
+    size = os.path.getsize(filename)
+    with open(filename, "rb") as f:
+        f.readline()
+        boundaries = [f.tell()]
+        for k in range(1, n):
+            target = max(size * k // n, boundaries[-1])
+            f.seek(target)
+            #move to the start of the next line...
+            if target > 0:
+                f.seek(target - 1)
+                f.readline()
+            #...and on to the first line of the next website
+            previous_dl_slot = None
+            while True:
+                position = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                row = next(csv.reader([line.decode("utf-8", "replace")], delimiter="\t"), [])
+                dl_slot = row[dl_slot_col] if len(row) > dl_slot_col else None
+                if previous_dl_slot is not None and dl_slot != previous_dl_slot:
+                    break
+                previous_dl_slot = dl_slot
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if end > start]
+
+
+#function which yields the decoded lines of a file between the byte offsets start and end
+def read_lines(f, start, end):
+    f.seek(start)
+    position = start
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line.decode("utf-8")
+
+
+#function which aggregates the rows in the byte range start-end of filename into partname (no header)
+#returns the number of skipped rows
+def aggregate_shard(filename, start, end, header, partname):
+    columns = dict((field, i) for i, field in enumerate(header))
+    skipped = [0]
+    with open(filename, "rb", buffering=BUFFER_SIZE) as inputfile, open(partname, "w", encoding="utf-8", newline="", buffering=BUFFER_SIZE) as outputfile:
+        reader = csv.reader(read_lines(inputfile, start, end), delimiter="\t")
+        for website in aggregate_rows(read_rows(reader, len(header), skipped), columns):
+            outputfile.write(format_row(website))
+    return skipped[0]
+
+
+#aggregates webpage-level text spider output to website level
+#uncompressed files are split at website boundaries and aggregated by workers processes in parallel
+def aggregate_webpages(filepath=None, workers=1):
     try:
         filename = filepath.split("\\")[0]
-        data = pd.read_csv(filename, encoding="utf-8", sep="\t", error_bad_lines=False, chunksize=25000)
-        outputfile = open(filename.split(".")[0] + "_aggregated.csv", "w", encoding='utf-8')
-        outputfile.write("ID" + "\t" + "dl_rank" + "\t" + "dl_slot" + "\t" + "error" + "\t" + "redirect" + "\t" + "start_page" + "\t" + "title" + "\t" + "keywords" + "\t" + "description" + "\t" + "text" + "\t" + "timestamp\n")
-        
-        c=0
-        # iterate chunks
-        for chunk in data:
-            # chunk data
-            IDs = chunk["ID"].values.tolist()
-            errors = chunk["error"].values.tolist()
-            redirects = chunk["redirect"].values.tolist()
-            start_pages = chunk["start_page"].values.tolist()
-            timestamps = chunk["timestamp"].values.tolist()
-            texts = chunk["text"].values.tolist()
-            dl_slots = chunk["dl_slot"].values.tolist()
-            dl_ranks = chunk["dl_rank"].values.tolist()
-            titles = chunk["title"].values.tolist()
-            keywordss = chunk["keywords"].values.tolist()
-            descriptions = chunk["description"].values.tolist()
-            output = ""
-            
-            # iterate webpage texts
-            for i, text in enumerate(texts):
-                if str(text) == "nan":
-                    text = ""
-                
-                # if first webpage, initialize aggregator
-                if c==0:
-                    dl_slot = dl_slots[i]
-                    website_text = text
-                    dl_rank = dl_ranks[i]
-                    ID = IDs[i]
-                    error = errors[i]
-                    start_page = start_pages[i]
-                    timestamp = timestamps[i]
-                    redirect = redirects[i]
-                    title = titles[i]
-                    keywords = keywordss[i]
-                    description = descriptions[i]
-                    c+=1
-                
-                # if not same webpage, write and empty aggregator
-                if dl_slots[i] != dl_slot:
-                    output = output + "\t".join([str(x) for x in [ID, dl_rank, dl_slot, error, redirect, start_page, title, keywords, description, website_text, timestamp]]) + "\n"
-                    dl_slot = dl_slots[i]
-                    website_text = text
-                    dl_rank = dl_ranks[i]
-                    ID = IDs[i]
-                    error = errors[i]
-                    start_page = start_pages[i]
-                    timestamp = timestamps[i]
-                    redirect = redirects[i]
-                    title = titles[i]
-                    keywords = keywordss[i]
-                    description = descriptions[i]
-                
-                # if same website, aggregate texts
-                website_text = website_text + text
-                dl_rank = dl_ranks[i]
-            outputfile.write(output)
-            
-        outputfile.close()
-        return filename.split(".")[0] + "_aggregated.csv"
+        outputname = filename.split(".")[0] + "_aggregated.csv"
+        skipped = [0]
+        if workers > 1 and not is_compressed(filename):
+            with open(filename, encoding="utf-8", newline="") as inputfile:
+                header = next(csv.reader(inputfile, delimiter="\t"))
+            shards = plan_shards(filename, workers, header.index("dl_slot"))
+            partnames = ["{}.part{}".format(outputname, i) for i in range(len(shards))]
+            with ProcessPoolExecutor(workers) as pool:
+                results = [pool.submit(aggregate_shard, filename, start, end, header, partname) for (start, end), partname in zip(shards, partnames)]
+                skipped[0] = sum(result.result() for result in results)
+            #concatenate the parts in order
+            with open(outputname, "w", encoding="utf-8", newline="") as outputfile:
+                outputfile.write(format_row(AGGREGATED_FIELDS))
+            with open(outputname, "ab") as outputfile:
+                for partname in partnames:
+                    with open(partname, "rb") as part:
+                        shutil.copyfileobj(part, outputfile, BUFFER_SIZE)
+                    os.unlink(partname)
+        else:
+            #gzip or zstd compressed files are decompressed while reading
+            with open_output_file(filename, newline="") as inputfile, open(outputname, "w", encoding="utf-8", newline="", buffering=BUFFER_SIZE) as outputfile:
+                reader = csv.reader(inputfile, delimiter="\t")
+                header = next(reader)
+                columns = dict((field, i) for i, field in enumerate(header))
+                outputfile.write(format_row(AGGREGATED_FIELDS))
+                #each website is written as soon as all its webpages were read
+                for website in aggregate_rows(read_rows(reader, len(header), skipped), columns):
+                    outputfile.write(format_row(website))
+        if skipped[0]:
+            print("Skipped {} webpages because of formatting errors.".format(skipped[0]))
+        return outputname
     except:
-        print("Error! Please select a file containing webpage-level text spider output.")
\ No newline at end of file
+        print("Error! Please select a file containing webpage-level text spider output.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregates webpage-level text spider output to website level.")
+    parser.add_argument("filepath", help="merged text spider output (_scraped_texts.csv)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+    print("Aggregated webpage texts to:\n{}".format(aggregate_webpages(args.filepath, args.workers)))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+URL chunk planning of start_crawl.
+
+Every chunk becomes one scrapyd job and scrapyd runs max_proc jobs at a time,
+queueing the rest. Small chunks therefore work like a work queue: a process
+that finishes early simply picks up the next pending chunk, so a few chunks
+full of large websites cannot keep single processes running long after all
+others are done.
+
+If the output of a previous run is given, the websites are additionally
+balanced by their estimated cost (number of downloaded webpages) with the
+longest-processing-time-first rule: websites are assigned in the order of
+decreasing cost to the chunk with the lowest total cost so far.
+"""
+
+import heapq
+import math
+
+import numpy as np
+import pandas as pd
+
+from ARGUS.compression import open_output_file
+
+
+#function which reads the estimated cost (number of webpages) of each website ID from an output file of a previous run
+#textspider output (webpage-level or aggregated): highest dl_rank + 1, other output: number of rows
+def read_site_costs(filepath):
+    if filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        header = pq.read_schema(filepath).names
+        columns = [column for column in ("ID", "dl_rank") if column in header]
+        chunks = [pd.read_parquet(filepath, columns=columns).astype(str)]
+        f = None
+    else:
+        f = open_output_file(filepath)
+        header = f.readline().rstrip("\r\n").split("\t")
+        f.seek(0)
+        columns = [column for column in ("ID", "dl_rank") if column in header]
+        chunks = pd.read_csv(f, sep="\t", usecols=columns, dtype=str, keep_default_na=False, chunksize=10**6)
+    if "ID" not in columns:
+        raise ValueError("{} has no ID column".format(filepath))
+
+    costs = []
+    try:
+        for chunk in chunks:
+            if "dl_rank" in columns:
+                rank = pd.to_numeric(chunk["dl_rank"], errors="coerce").fillna(0) + 1
+                costs.append(rank.groupby(chunk["ID"]).max())
+            else:
+                costs.append(chunk.groupby("ID").size())
+    finally:
+        if f is not None:
+            f.close()
+    if not costs:
+        return pd.Series(dtype=float)
+    costs = pd.concat(costs)
+    if "dl_rank" in columns:
+        return costs.groupby(level=0).max().astype(float)
+    return costs.groupby(level=0).sum().astype(float)
+
+
+#function which returns the number of chunks: chunks of at most chunk_size URLs, but at least one chunk per process
+def n_chunks(n_urls, chunk_size, n_processes):
+    return max(math.ceil(n_urls / chunk_size), n_processes, 1)
+
+
+#function which returns the estimated cost of every row of data (indexed by website ID),
+#websites without a known cost are assumed to cost the median of the known costs
+def row_costs(data, costs):
+    site_costs = pd.Series(data.index.astype(str), dtype=object).map(costs)
+    return site_costs.fillna(costs.median()).to_numpy(dtype=float)
+
+
+#function which splits the rows of data (indexed by website ID) into n chunks
+#without costs, the rows are split into contiguous chunks of (almost) equal size;
+#with costs (website ID -> estimated cost), the chunks get (almost) equal total cost
+#returns a list of row position arrays, each in the original row order
+def plan_chunks(data, n, costs=None):
+    if costs is None or len(costs) == 0:
+        return np.array_split(np.arange(len(data)), n)
+
+    site_costs = row_costs(data, costs)
+    #longest processing time first: the most expensive websites are placed first,
+    #each into the chunk with the lowest total cost so far
+    loads = [(0.0, k) for k in range(n)]
+    assignment = np.empty(len(data), dtype=np.int64)
+    for position in np.argsort(-site_costs, kind="stable"):
+        load, k = loads[0]
+        assignment[position] = k
+        heapq.heapreplace(loads, (load + site_costs[position], k))
+    order = np.argsort(assignment, kind="stable")
+    return np.split(order, np.cumsum(np.bincount(assignment, minlength=n))[:-1])
+
+
+#function which returns the estimated total cost of each chunk (number of URLs if no costs are known)
+def chunk_costs(data, chunks, costs=None):
+    if costs is None or len(costs) == 0:
+        return [len(chunk) for chunk in chunks]
+    site_costs = row_costs(data, costs)
+    return [site_costs[chunk].sum() for chunk in chunks]
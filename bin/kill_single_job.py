@@ -5,8 +5,12 @@ Created on Tue Jun 19 13:11:04 2018
 @author: jki
 """
 
-import subprocess
+from bin.scrapyd_client import ScrapydClient
 
-jobid = input("Enter job id: ")
 def kill_job(jobid=None):
-    subprocess.run(r"curl http://localhost:6800/cancel.json -d project=ARGUS -d job={}".format(jobid))
\ No newline at end of file
+    with ScrapydClient() as client:
+        client.cancel(jobid)
+
+
+if __name__ == "__main__":
+    kill_job(input("Enter job id: "))
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Web graph export of the link spider postprocessing.
+
+Encodes the links between websites as integers and writes them as
+NumPy files which can be loaded (or memory-mapped) without any string parsing:
+
+<prefix>_graph_domains.tsv   id, domain, and 1 if the domain is in the URL list (internal), else 0
+<prefix>_graph_src.npy       deduplicated edge list: source domain ids...
+<prefix>_graph_dst.npy       ...and target domain ids, sorted by source and target
+<prefix>_graph_indptr.npy    compressed sparse row adjacency: the targets of domain i are
+<prefix>_graph_indices.npy   indices[indptr[i]:indptr[i+1]]
+
+e.g. scipy.sparse.csr_matrix((np.ones(len(indices)), indices, indptr)) or
+np.load(prefix + "_graph_indices.npy", mmap_mode="r")
+"""
+
+from array import array
+
+import numpy as np
+
+
+class LinkGraph(object):
+
+    def __init__(self):
+        #domain -> id, internal domains get the first ids
+        self.ids = {}
+        self.n_internal = 0
+        self.src = array("q")
+        self.dst = array("q")
+
+    def id(self, domain):
+        domain_id = self.ids.get(domain)
+        if domain_id is None:
+            domain_id = self.ids[domain] = len(self.ids)
+        return domain_id
+
+    #adds domains of the URL list, has to be called before any links are added
+    def add_internal(self, domains):
+        for domain in domains:
+            self.id(domain)
+        self.n_internal = len(self.ids)
+
+    #adds the links from a website to other domains (empty links and links to itself are skipped)
+    def add(self, dl_slot, links):
+        src = self.id(dl_slot)
+        for link in links:
+            if link == "" or link == dl_slot:
+                continue
+            self.src.append(src)
+            self.dst.append(self.id(link))
+
+    #writes the domain dictionary, the deduplicated edge list, and the csr adjacency
+    def save(self, prefix):
+        n = len(self.ids)
+        dtype = np.int32 if n < 2**31 else np.int64
+        #duplicate edges are removed by sorting the edges encoded as single integers
+        edges = np.unique(np.frombuffer(self.src, dtype=np.int64) * n + np.frombuffer(self.dst, dtype=np.int64))
+        src = (edges // n).astype(dtype)
+        dst = (edges % n).astype(dtype)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+
+        with open(prefix + "_graph_domains.tsv", "w", encoding="utf-8") as f:
+            f.write("id\tdomain\tinternal\n")
+            for domain, domain_id in self.ids.items():
+                f.write("{}\t{}\t{}\n".format(domain_id, domain, 1 if domain_id < self.n_internal else 0))
+        np.save(prefix + "_graph_src.npy", src)
+        np.save(prefix + "_graph_dst.npy", dst)
+        np.save(prefix + "_graph_indptr.npy", indptr)
+        np.save(prefix + "_graph_indices.npy", dst)
+        return n, len(edges)
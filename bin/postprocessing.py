@@ -6,28 +6,319 @@ Created on Wed Mar 28 15:55:05 2018
 """
 import configparser
 import os
+import shutil
+import sqlite3
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import messagebox
+from ARGUS.compression import is_compressed, open_output_file
+from ARGUS.exporters import BUFFER_SIZE
+from bin.linkgraph import LinkGraph
+
+
+#size of the blocks copied at once when merging chunks
+COPY_BLOCK_SIZE = 64 * 1024 * 1024
+
+
+#prints the merging progress based on the bytes copied so far (thread-safe)
+class MergeProgress(object):
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.next_percent = 5
+        self.lock = threading.Lock()
+
+    def add(self, n):
+        with self.lock:
+            self.done += n
+            percent = 100 * self.done / self.total if self.total else 100
+            if percent >= self.next_percent:
+                print("Processed {} % of data ({:.0f} of {:.0f} MB)".format(int(percent), self.done / 1e6, self.total / 1e6))
+                self.next_percent = (int(percent) // 5 + 1) * 5
+
+
+#function which copies count bytes of src_fn starting at src_offset into dst_fn at dst_offset
+#copy_file_range (or sendfile on linux) copies inside the kernel without passing the data through
+#python, other systems fall back to large buffered reads and writes
+def copy_range(src_fn, dst_fn, src_offset, dst_offset, count, progress):
+    fast_copy = hasattr(os, "copy_file_range") or (hasattr(os, "sendfile") and sys.platform.startswith("linux"))
+    with open(src_fn, "rb", buffering=0) as src, open(dst_fn, "r+b", buffering=0) as dst:
+        while count > 0:
+            block = min(count, COPY_BLOCK_SIZE)
+            copied = 0
+            if fast_copy:
+                try:
+                    if hasattr(os, "copy_file_range"):
+                        copied = os.copy_file_range(src.fileno(), dst.fileno(), block, src_offset, dst_offset)
+                    else:
+                        os.lseek(dst.fileno(), dst_offset, os.SEEK_SET)
+                        copied = os.sendfile(dst.fileno(), src.fileno(), src_offset, block)
+                except OSError:
+                    #e.g. not supported between these file systems
+                    fast_copy = False
+            if not copied:
+                src.seek(src_offset)
+                data = src.read(block)
+                if not data:
+                    raise IOError("{} is shorter than expected".format(src_fn))
+                dst.seek(dst_offset)
+                view = memoryview(data)
+                while view:
+                    view = view[dst.write(view):]
+                copied = len(data)
+            src_offset += copied
+            dst_offset += copied
+            count -= copied
+            progress.add(copied)
+
+
+#function which merges text spider output chunks into one csv file
+#the column names are taken from the first non-empty chunk, the rows of all chunks are copied as
+#bytes without parsing them: uncompressed chunks are copied in parallel into their pre-computed
+#offsets of the pre-sized merged file, compressed chunks are decompressed and appended after that
+def merge_text_chunks(output_files, output, n_workers=1):
+    header = b""
+    plain = []
+    compressed = []
+    for fn in output_files:
+        if is_compressed(fn):
+            compressed.append(fn)
+            continue
+        with open(fn, "rb") as f:
+            first_line = f.readline()
+        if not header:
+            header = first_line
+        plain.append((fn, len(first_line), os.path.getsize(fn) - len(first_line)))
+    for fn in compressed:
+        if header:
+            break
+        with open_output_file(fn, encoding=None) as f:
+            header = f.readline()
+
+    plain_size = sum(size for fn, header_size, size in plain)
+    progress = MergeProgress(plain_size + sum(os.path.getsize(fn) for fn in compressed))
+    with open(output, "wb") as merged_file:
+        merged_file.write(header)
+        merged_file.truncate(len(header) + plain_size)
+
+    #copy the uncompressed chunks
+    offset = len(header)
+    with ThreadPoolExecutor(max(n_workers, 1)) as pool:
+        copies = []
+        for fn, header_size, size in plain:
+            copies.append(pool.submit(copy_range, fn, output, header_size, offset, size, progress))
+            offset += size
+        for copy in copies:
+            copy.result()
+
+    #append the compressed chunks
+    with open(output, "ab") as merged_file:
+        for fn in compressed:
+            with open_output_file(fn, encoding=None) as f:
+                f.readline()
+                shutil.copyfileobj(f, merged_file, BUFFER_SIZE)
+            progress.add(os.path.getsize(fn))
+
+
+#function which merges parquet output chunks row group by row group into one parquet file
+#texts are only copied between arrow buffers and never converted to python strings, except
+#for the links of the linkspider which are divided into internal and external links
+def merge_parquet(output_files, output, links=False, graph=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    errors = 0
+    if links:
+        #all internal (given in user url list) domains, only the dl_slot column is read
+        all_internal_links = set()
+        for fn in output_files:
+            dl_slots = pq.read_table(fn, columns=["dl_slot"]).column("dl_slot").to_pylist()
+            all_internal_links.update(dl_slots)
+            if graph is not None:
+                graph.add_internal(dl_slots)
+        schema = pq.read_schema(output_files[0])
+        fields = [field for field in schema if field.name != "links"]
+        links_index = schema.get_field_index("links")
+        schema = pa.schema(fields[:links_index] + [pa.field("links_internal", pa.string()), pa.field("links_external", pa.string())] + fields[links_index:])
+    else:
+        schema = pq.read_schema(output_files[0])
+    writer = pq.ParquetWriter(output, schema, compression="zstd")
+
+    for tick, fn in enumerate(output_files, 1):
+        try:
+            f = pq.ParquetFile(fn)
+            for i in range(f.num_row_groups):
+                table = f.read_row_group(i)
+                if links:
+                    links_internal = []
+                    links_external = []
+                    for dl_slot, site_links in zip(table.column("dl_slot").to_pylist(), table.column("links").to_pylist()):
+                        site_links = (site_links or "").split(",")
+                        if graph is not None:
+                            graph.add(dl_slot, site_links)
+                        #first item is self --> easier to import into analysis software later on
+                        internal = [dl_slot]
+                        external = [dl_slot]
+                        saved = {dl_slot}
+                        for link in site_links:
+                            if link == "":
+                                continue
+                            if link in all_internal_links:
+                                if link not in saved:
+                                    saved.add(link)
+                                    internal.append(link)
+                            else:
+                                external.append(link)
+                        links_internal.append(",".join(internal) if len(internal) > 1 else "")
+                        links_external.append(",".join(external) if len(external) > 1 else "")
+                    table = table.drop(["links"])
+                    table = table.add_column(links_index, "links_external", pa.array(links_external, pa.string()))
+                    table = table.add_column(links_index, "links_internal", pa.array(links_internal, pa.string()))
+                writer.write_table(table.cast(schema))
+        except Exception:
+            errors += 1
+        print("Processed {} of {} files".format(tick, len(output_files)))
+    writer.close()
+    return errors
+
+
+#on-disk index of the internal domains of the link spider postprocessing for populations whose
+#domain set does not fit into memory; the domains are kept in a sqlite b-tree and provides the
+#update and intersection methods of set
+class DiskDomainIndex(object):
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("CREATE TABLE domains (domain TEXT PRIMARY KEY) WITHOUT ROWID")
+        #number of domains inserted or looked up per statement
+        self.batch_size = batch_size
+
+    def update(self, domains):
+        self.db.executemany("INSERT OR IGNORE INTO domains VALUES (?)", ((domain,) for domain in domains))
+        self.db.commit()
+
+    #returns the set of the given domains which are in the index
+    def intersection(self, domains):
+        domains = list(set(domains))
+        found = set()
+        for i in range(0, len(domains), self.batch_size):
+            batch = domains[i:i + self.batch_size]
+            query = "SELECT domain FROM domains WHERE domain IN ({})".format(",".join("?" * len(batch)))
+            found.update(row[0] for row in self.db.execute(query, batch))
+        return found
+
+    def close(self):
+        self.db.close()
+        os.unlink(self.path)
+
+
+#function which writes the link spider output chunks to merged_file with the links of each website divided
+#into links to the internal population (all crawled dl_slots) and external links
+#pass 1 collects the dl_slots into internal_domains (a set or a DiskDomainIndex), pass 2 classifies the links
+#and adds them to graph (a LinkGraph) if given; returns the number of rows skipped because of formatting errors
+def classify_links(output_files, merged_file, internal_domains, graph=None):
+    errors = 0
+    for fn in output_files:
+        dl_slots = []
+        f = open_output_file(fn)
+        f.readline()
+        for line in f:
+            if line == "\n":
+                continue
+            line = line.split("\t", 3)
+            if len(line) < 3:
+                errors += 1
+                continue
+            dl_slots.append(line[2])
+        f.close()
+        internal_domains.update(dl_slots)
+        if graph is not None:
+            graph.add_internal(dl_slots)
+
+    progress = MergeProgress(sum(os.path.getsize(fn) for fn in output_files))
+    c=0
+    for fn in output_files:
+        f = open_output_file(fn)
+        #if first chunk write the column names
+        if c == 0:
+            line = f.readline().split("\t")
+            #columns after links (redirect, timestamp, url, and link_counts if written) are kept as they are
+            first_line = line[0] + "\t" + line[1] + "\t" + line[2] + "\t" + line[3] + "\t" + "links_internal" + "\t" + "links_external" + "\t" + "\t".join(line[5:])
+            merged_file.write(first_line)
+            c+=1
+        #for other chunks, skip first line
+        else:
+            f.readline()
+
+        #iterate lines and extract links, divide into internal and external links, write to output file
+        for line in f:
+            if line == "\n":
+                continue
+            line = line.split("\t")
+            if len(line) < 8:
+                errors += 1
+                continue
+            links = line[4].split(",")
+            if graph is not None:
+                graph.add(line[2], links)
+            internal_links = internal_domains.intersection(links)
+            #lists to collect links which are either from initial/internal population or from external websites
+            #first item is self --> easier to import into analysis software later on
+            links_internal = [line[2]]
+            links_external = [line[2]]
+            saved = {line[2]}
+            for link in links:
+                if link == "":
+                    continue
+                #if the link is from the internal population and has not been saved yet, add to internal links
+                if link in internal_links:
+                    if link not in saved:
+                        saved.add(link)
+                        links_internal.append(link)
+                #...if not from internal population add to external population
+                else:
+                    links_external.append(link)
+
+            #create output string
+            links_internal = ",".join(links_internal) if len(links_internal) > 1 else ""
+            links_external = ",".join(links_external) if len(links_external) > 1 else ""
+
+            #write to output file
+            merged_file.write(line[0] + "\t" + line[1] + "\t" + line[2] + "\t" + line[3] + "\t" + links_internal + "\t" + links_external + "\t" + "\t".join(line[5:]))
+        f.close()
+        progress.add(os.path.getsize(fn))
+    return errors
 
 
 def postprocessing(cwd=None):
     #read settings file
     config = configparser.RawConfigParser()   
-    config.read(r".\bin\settings.txt")
+    config.read(os.path.join("bin", "settings.txt"))
     
     #get files
     if config.get('spider-settings', 'spider') == "text":
-        merged_file = open(config.get('input-data', 'filepath').split(".")[0] +   "_scraped_texts.csv", "w", encoding="utf-8")
         output = config.get('input-data', 'filepath').split(".")[0] + "_scraped_texts.csv"
     elif config.get('spider-settings', 'spider') == "link":
-        merged_file = open(config.get('input-data', 'filepath').split(".")[0] +   "_scraped_links.csv", "w", encoding="utf-8")
         output = config.get('input-data', 'filepath').split(".")[0] + "_scraped_links.csv"
     elif config.get('spider-settings', 'spider') == "webarchive":
-        merged_file = open(config.get('input-data', 'filepath').split(".")[0] +   "_webarchive_scraped_texts.csv", "w", encoding="utf-8")
         output = config.get('input-data', 'filepath').split(".")[0] + "_webarchive_scraped_texts.csv"
-    output_files = [cwd + "\\chunks\\" + f for f in os.listdir(cwd + "\\chunks") if f.split("_")[0] == "output"]
+    output_files = [os.path.join(cwd, "chunks", f) for f in os.listdir(os.path.join(cwd, "chunks")) if f.split("_")[0] == "output"]
+    #chunks written with OUTPUT_FORMAT = "parquet" are merged into a parquet file
+    parquet_files = [fn for fn in output_files if fn.endswith(".parquet")]
+    if parquet_files:
+        output = output[:-len(".csv")] + ".parquet"
+    #website-level rows written by the text pipeline with OUTPUT_LEVEL = "website" or "both"
+    website_files = [os.path.join(cwd, "chunks", f) for f in os.listdir(os.path.join(cwd, "chunks")) if f.startswith("website_output_")]
 
-    len_output_files = len(output_files)
+    len_output_files = len(output_files) + len(website_files)
     if len_output_files == 0:
         messagebox.showinfo("Nothing found to postprocess", "Nothing found to postprocess.\nMaybe postprocessing was executed already. Check location:\n{}".format(output))
         return
@@ -36,180 +327,62 @@ def postprocessing(cwd=None):
     time.sleep(2)
     
     errors = 0
-    tick = 0 
+    #optional integer-encoded web graph of the linkspider output
+    graph = None
+    if config.get('spider-settings', 'spider') == "link" and config.get('spider-settings', 'link_graph', fallback="off") == "on":
+        graph = LinkGraph()
     
-    #textspider postprocessing
-    if config.get('spider-settings', 'spider') == "text":
-        print("Using text spider postprocessing procedure. This may take a few minutes...")
-    #merge chunks
-        c=0
-        for fn in output_files:
-            tick += 1
-
-            if tick == int(len_output_files * 0.05):
-                print ("Processed 5 % of files")
-            elif tick == int(len_output_files * 0.15):
-                print ("Processed 15 % of files")
-            elif tick == int(len_output_files * 0.25):
-                print ("Processed 25 % of files")
-            elif tick == int(len_output_files * 0.50):
-                print ("Processed 50 % of files")
-            elif tick == int(len_output_files * 0.75):
-                print ("Processed 75 % of files")
-            elif tick == int(len_output_files):
-                print ("Processed 100 % of files")
-            
-            f = open(fn, encoding="utf-8")
-            #if first file write the column names
-            if c == 0:
-                merged_file.write(f.readline())
-                c+=1
-            else:
-                f.readline()
-            while 1:
-                line = f.readline()
-                if not line:
-                    break
-                merged_file.write(line)
-            f.close()
+    #parquet postprocessing
+    if parquet_files:
+        print("Using parquet postprocessing procedure. This may take a few minutes...")
+        errors = merge_parquet(parquet_files, output, config.get('spider-settings', 'spider') == "link", graph)
     
-    #webarchive textspider postprocessing
-    if config.get('spider-settings', 'spider') == "webarchive":
-        print("Using webarchive text spider postprocessing procedure. This may take a few minutes...")
-    #merge chunks
-        c=0
-        for fn in output_files:
-            tick += 1
-
-            if tick == int(len_output_files * 0.05):
-                print ("Processed 5 % of files")
-            elif tick == int(len_output_files * 0.15):
-                print ("Processed 15 % of files")
-            elif tick == int(len_output_files * 0.25):
-                print ("Processed 25 % of files")
-            elif tick == int(len_output_files * 0.50):
-                print ("Processed 50 % of files")
-            elif tick == int(len_output_files * 0.75):
-                print ("Processed 75 % of files")
-            elif tick == int(len_output_files):
-                print ("Processed 100 % of files")
-
-            f = open(fn, encoding="utf-8")
-            #if first file write the column names
-            if c == 0:
-                merged_file.write(f.readline())
-                c+=1
-            else:
-                f.readline()
-            while 1:
-                line = f.readline()
-                if not line:
-                    break
-                merged_file.write(line)
-            f.close()
+    #textspider and webarchive textspider postprocessing
+    elif config.get('spider-settings', 'spider') in ("text", "webarchive"):
+        if config.get('spider-settings', 'spider') == "text":
+            print("Using text spider postprocessing procedure. This may take a few minutes...")
+        else:
+            print("Using webarchive text spider postprocessing procedure. This may take a few minutes...")
+        #merge chunks, using as many parallel copies as cores used for scraping
+        if output_files:
+            merge_text_chunks(output_files, output, int(config.get('system', 'n_cores', fallback="1")))
 
     #linkspider postprocessing
     elif config.get('spider-settings', 'spider') == "link":
+        merged_file = open(output, "w", encoding="utf-8")
         print("Using link spider postprocessing procedure. This may take a few minutes...")
-        #generate list of all internal (given in user url list) domains
-        all_internal_links = []
-        for fn in output_files:
-            f = open(fn, encoding="utf-8")
-            f.readline()
-            while 1:
-                try:
-                    line = f.readline()
-                    if not line:
-                        break
-                    if line == "\n":
-                        continue
-                    line = line.split("\t")
-                    dl_slot = line[2]
-                    if dl_slot not in all_internal_links:
-                        all_internal_links.append(dl_slot)
-                except:
-                    errors += 1
-                    continue
-            f.close()
-        #write outputfile
-        c=0
-        for fn in output_files:
-            tick += 1
-            if tick == int(len_output_files * 0.05):
-                print ("Processed 5 % of files")
-            elif tick == int(len_output_files * 0.15):
-                print ("Processed 15 % of files")
-            elif tick == int(len_output_files * 0.25):
-                print ("Processed 25 % of files")
-            elif tick == int(len_output_files * 0.50):
-                print ("Processed 50 % of files")
-            elif tick == int(len_output_files * 0.75):
-                print ("Processed 75 % of files")
-            elif tick == int(len_output_files):
-                print ("Processed 100 % of files")
-            
-            f = open(fn, encoding="utf-8")
-            #if first chunk write the column names
-            if c == 0:
-                line = f.readline().split("\t")
-                first_line = line[0] + "\t" + line[1] + "\t" + line[2] + "\t" + line[3] + "\t" + "links_internal" + "\t" + "links_external" + "\t" + line[5] + "\t"  + line[6] + "\t" + line[7]
-                merged_file.write(first_line)
-                c+=1
-            #for other chunks, skip first line
-            else:
-                f.readline()
-           
-            #iterate lines and extract links, divide into internal and external links, write to output file
-            while 1:
-                try:
-                    line = f.readline()
-                    if not line:
-                        break
-                    if line == "\n":
-                        continue
-                    line = line.split("\t")
-                    links = line[4].split(",")
-                    #lists to collect links which are either from initial/internal population or from external websites
-                    #first item is self --> easier to import into analysis software later on
-                    links_internal = [line[2]]
-                    links_external = [line[2]]
-                    for link in links:
-                        if link == "":
-                            continue
-                        #if the link is from the internal population...
-                        if link in all_internal_links:
-                            #...and has not been saved yet, add to internal links
-                            if link not in links_internal:
-                                links_internal.append(link)
-                        #...if not from internal population add to external population
-                        else:
-                            links_external.append(link)
-                            
-                    #create output string
-                    if len(links_internal) == 1:
-                        links_internal = ""
-                    else:
-                        links_internal = ",".join(links_internal)   
-                    if len(links_external) == 1:
-                        links_external = ""
-                    else:
-                        links_external = ",".join(links_external)
-        
-                    #write to output file                    
-                    output_line = line[0] + "\t" + line[1] + "\t" + line[2] + "\t" + line[3] + "\t" + links_internal + "\t" + links_external + "\t" + line[5] + "\t"  + line[6] + "\t" + line[7]
-                    merged_file.write(output_line)
-                except:
-                    errors += 1
-                    continue
-            f.close()        
-    merged_file.close()    
+        #index of all internal (given in user url list) domains, a set or an on-disk index if memory is tight
+        if config.get('system', 'link_index', fallback="memory") == "disk":
+            internal_domains = DiskDomainIndex(output + ".index")
+        else:
+            internal_domains = set()
+        errors = classify_links(output_files, merged_file, internal_domains, graph)
+        if isinstance(internal_domains, DiskDomainIndex):
+            internal_domains.close()
+        merged_file.close()    
+
+    if graph is not None:
+        graph_prefix = output.rsplit(".", 1)[0]
+        n_domains, n_edges = graph.save(graph_prefix)
+        print("Saved web graph with {} domains and {} links to {}_graph_*".format(n_domains, n_edges, graph_prefix))
     
+    #merge website-level chunks like the aggregator output
+    outputs = [output] if output_files else []
+    if website_files:
+        aggregated_output = output.rsplit(".", 1)[0] + "_aggregated." + ("parquet" if website_files[0].endswith(".parquet") else "csv")
+        print("Merging website-level output files to ", aggregated_output, " ...")
+        if aggregated_output.endswith(".parquet"):
+            errors += merge_parquet(website_files, aggregated_output)
+        else:
+            merge_text_chunks(website_files, aggregated_output, int(config.get('system', 'n_cores', fallback="1")))
+        outputs.append(aggregated_output)
+
     print("Merging done. Skipped {} websites because of formatting errors. Deleting leftovers...".format(errors))
     time.sleep(5)
     
-    #delete chunks
-    chunk_files = [os.getcwd() + "\\chunks\\" + f for f in os.listdir(os.getcwd() + "\\chunks") if f.split("_")[0] == "url"]
+    #delete chunks and completion journals
+    chunk_files = [os.path.join(os.getcwd(), "chunks", f) for f in os.listdir(os.path.join(os.getcwd(), "chunks")) if f.split("_")[0] in ("url", "journal")]
     
-    for fn in output_files + chunk_files:
+    for fn in output_files + website_files + chunk_files:
         os.unlink(fn)
-    messagebox.showinfo("Postprocessing successful", "Postprocessing successful. Scraped data can be found:\n{}".format(output))
+    messagebox.showinfo("Postprocessing successful", "Postprocessing successful. Scraped data can be found:\n{}".format("\n".join(outputs)))
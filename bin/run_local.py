@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Runs an ARGUS crawl without scrapyd.
+
+Splits the URL file into url chunks like start_crawl and starts the given
+number of worker processes. Every worker runs one Scrapy CrawlerProcess which
+takes url chunks from a shared queue and crawls them one after another until
+the queue is empty. The spiders get the same arguments and settings as the
+scrapyd jobs, so the output files in the chunks directory are the same and
+can be merged with postprocessing afterwards.
+
+usage: python -m bin.run_local [--settings bin/settings.txt] [--workers n_cores] [--resume]
+(run from the ARGUS directory)
+"""
+
+import argparse
+import configparser
+import multiprocessing
+import os
+import time
+
+from bin.start_crawl import language_codes, spider_arguments, spider_name, spider_settings, url_chunk_path, write_url_chunks
+
+
+#function which crawls url chunks from queue in one CrawlerProcess until it gets None
+def crawl_chunks(queue, worker, spider, arguments, settings):
+    os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "ARGUS.settings")
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    from twisted.internet import defer
+
+    project_settings = get_project_settings()
+    project_settings.setdict(settings, priority="cmdline")
+    #one log file per worker, the chunks it crawled are logged in order
+    project_settings.set("LOG_FILE", os.path.join("logs", "local", "{}_worker{}.log".format(spider, worker)), priority="cmdline")
+    process = CrawlerProcess(project_settings)
+    spidercls = process.spider_loader.load(spider)
+
+    @defer.inlineCallbacks
+    def crawl():
+        while True:
+            p = queue.get()
+            if p is None:
+                break
+            started = time.time()
+            yield process.crawl(spidercls, url_chunk=url_chunk_path(p), **arguments)
+            print("Worker {} finished chunk {} in {:.0f} sec.".format(worker, p, time.time() - started), flush=True)
+
+    crawl().addErrback(lambda failure: print("Worker {} failed:\n{}".format(worker, failure.getTraceback()), flush=True))
+    #the first crawl starts the reactor, which is stopped once all crawls are finished
+    process.start()
+
+
+#resume: continue an interrupted crawl, only websites which are not finished are crawled again
+def run_local(settings_file=os.path.join("bin", "settings.txt"), workers=None, resume=False):
+    config = configparser.RawConfigParser()
+    config.read(settings_file)
+    if workers is None:
+        workers = int(config.get('system', 'n_cores'))
+
+    url_chunks = write_url_chunks(config, resume)
+    if len(url_chunks) == 0:
+        print("All websites are finished, nothing to resume.")
+        return []
+    language_ISOs = language_codes(config)
+    spider = spider_name(config)
+    arguments = spider_arguments(config, language_ISOs)
+    settings = spider_settings(config)
+    os.makedirs(os.path.join("logs", "local"), exist_ok=True)
+
+    #a worker takes the next chunk as soon as it finished the last one, None tells it to stop
+    queue = multiprocessing.Queue()
+    for p in url_chunks:
+        queue.put(p)
+    workers = min(workers, len(url_chunks))
+    for worker in range(workers):
+        queue.put(None)
+
+    started = time.time()
+    processes = [multiprocessing.Process(target=crawl_chunks, args=(queue, worker, spider, arguments, settings)) for worker in range(1, workers+1)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    print("Crawled ", len(url_chunks), " parts with ", workers, " processes in ", round(time.time() - started), " seconds.")
+    return [process.exitcode for process in processes]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs an ARGUS crawl in local worker processes without scrapyd.")
+    parser.add_argument("--settings", default=os.path.join("bin", "settings.txt"), help="settings file written by the ARGUS GUI")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: n_cores of the settings file)")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted crawl, only unfinished websites are crawled again")
+    options = parser.parse_args()
+    run_local(options.settings, options.workers, options.resume)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Small scrapyd client used to schedule, list, and cancel ARGUS jobs.
+
+Keeps one persistent HTTP connection to scrapyd open for all requests,
+parses the JSON responses, and retries requests if the connection fails.
+A schedule request which may have reached scrapyd before the connection
+failed is only repeated if its job is not listed by scrapyd, so a url chunk
+is never scheduled twice.
+"""
+
+import http.client
+import json
+import time
+import uuid
+from urllib.parse import urlencode
+
+
+class ScrapydError(Exception):
+    pass
+
+
+class ScrapydClient(object):
+
+    def __init__(self, host="localhost", port=6800, project="ARGUS", retries=3, timeout=30):
+        self.host = host
+        self.port = port
+        self.project = project
+        self.retries = retries
+        self.timeout = timeout
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    #sends a request to a scrapyd endpoint and returns the parsed JSON response
+    #params is a list of (name, value) pairs, names may repeat (e.g. "setting")
+    #requests which must not be repeated (idempotent=False, default for POST) are only retried
+    #if the connection could not be made, the error is raised once the request may have been sent
+    def request(self, endpoint, params=None, post=False, idempotent=None):
+        if idempotent is None:
+            idempotent = not post
+        query = urlencode(params or [])
+        for attempt in range(self.retries + 1):
+            connection = self.connect()
+            try:
+                if connection.sock is None:
+                    connection.connect()
+            except OSError:
+                #scrapyd is not reachable (yet), nothing was sent
+                self.close()
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.5 * 2**attempt)
+                continue
+            try:
+                if post:
+                    connection.request("POST", "/" + endpoint, body=query, headers={"Content-Type": "application/x-www-form-urlencoded"})
+                else:
+                    connection.request("GET", "/" + endpoint + ("?" + query if query else ""))
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                #the connection was closed or scrapyd is restarting, reconnect and try again
+                self.close()
+                if not idempotent or attempt == self.retries:
+                    raise
+                time.sleep(0.5 * 2**attempt)
+        result = json.loads(body.decode("utf-8"))
+        if result.get("status") != "ok":
+            raise ScrapydError("{} failed: {}".format(endpoint, result.get("message", result)))
+        return result
+
+    #schedules a spider run and returns its job id
+    #args are passed to the spider, settings override the scrapy settings of the job
+    #the job id is chosen here, so that a job which scrapyd accepted before the connection failed can be found
+    def schedule(self, spider, args=None, settings=None):
+        job = uuid.uuid4().hex
+        params = [("project", self.project), ("spider", spider), ("jobid", job)]
+        params += [(name, value) for name, value in (args or {}).items()]
+        params += [("setting", "{}={}".format(name, value)) for name, value in (settings or {}).items()]
+        for attempt in range(self.retries + 1):
+            try:
+                return self.request("schedule.json", params, post=True)["jobid"]
+            except (http.client.HTTPException, OSError):
+                #scrapyd may have queued the job before the connection failed
+                if self.has_job(job):
+                    return job
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.5 * 2**attempt)
+
+    #schedules several spider runs, jobs is a list of (spider, args, settings)
+    def schedule_many(self, jobs):
+        return [self.schedule(spider, args, settings) for spider, args, settings in jobs]
+
+    def cancel(self, job):
+        #cancelling twice does no harm
+        return self.request("cancel.json", [("project", self.project), ("job", job)], post=True, idempotent=True)
+
+    def cancel_many(self, jobs):
+        return [self.cancel(job) for job in jobs]
+
+    #returns the pending, running, and finished jobs: {"pending": [{"id": ..., "spider": ...}, ...], ...}
+    def list_jobs(self):
+        return self.request("listjobs.json", [("project", self.project)])
+
+    #returns True if scrapyd knows the job (pending, running, or finished)
+    def has_job(self, job):
+        jobs = self.list_jobs()
+        return any(j["id"] == job for state in ("pending", "running", "finished") for j in jobs.get(state, []))
+
+    #cancels all pending and running jobs and returns their ids
+    def cancel_all(self):
+        jobs = self.list_jobs()
+        job_ids = [job["id"] for job in jobs.get("pending", []) + jobs.get("running", [])]
+        self.cancel_many(job_ids)
+        return job_ids
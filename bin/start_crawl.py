@@ -2,19 +2,126 @@
 
 
 import pandas as pd
-import numpy as np
+import codecs
 import configparser
-import math
 import time
-import subprocess
 import os
 import webbrowser
+from bin.scrapyd_client import ScrapydClient
+from bin import chunking
+from ARGUS import journal
 
 
-def start_crawl():
+#returns the name of the spider selected in the settings file
+def spider_name(config):
+	return config.get('spider-settings', 'spider') + "spider"
+
+
+#returns the arguments of the spider (except url_chunk) given by the settings file
+def spider_arguments(config, language_ISOs):
+	arguments = {"limit": config.get('spider-settings', 'limit'), "ID": config.get('input-data', 'ID'), "url_col": config.get('input-data', 'url'),
+				 "language": language_ISOs, "prefer_short_urls": config.get('spider-settings', 'prefer_short_urls'),
+				 "per_site_parallelism": config.get('spider-settings', 'per_site_parallelism', fallback="1")}
+	if spider_name(config) == "textspider":
+		arguments["stream_pages"] = config.get('spider-settings', 'stream_pages', fallback="off")
+	return arguments
+
+
+#returns the scrapy settings given by the settings file, output settings are passed to the pipelines
+def spider_settings(config):
+	settings = {"LOG_LEVEL": config.get('spider-settings', 'log_level'),
+				"OUTPUT_FORMAT": config.get('spider-settings', 'output_format', fallback="csv"),
+				"OUTPUT_COMPRESSION": config.get('spider-settings', 'output_compression', fallback="none"),
+				"OUTPUT_FLUSH_INTERVAL": config.get('spider-settings', 'output_flush_interval', fallback="60"),
+				"OUTPUT_LEVEL": config.get('spider-settings', 'output_level', fallback="webpage"),
+				"OUTPUT_LINK_COUNTS": config.get('spider-settings', 'link_counts', fallback="off") == "on"}
+	if config.has_option('spider-settings', 'output_compression_level'):
+		settings["OUTPUT_COMPRESSION_LEVEL"] = config.get('spider-settings', 'output_compression_level')
+	#the cache directory is shared by all jobs and kept between crawls
+	if config.get('spider-settings', 'http_cache', fallback="off") == "on":
+		settings["HTTPCACHE_ENABLED"] = True
+		settings["HTTPCACHE_DIR"] = os.path.join(os.getcwd(), "httpcache")
+		settings["HTTPCACHE_MAX_SIZE"] = int(float(config.get('spider-settings', 'http_cache_size', fallback="10000")) * 1000000)
+	return settings
+
+
+#returns the ISO codes of the language selected in the settings file for language detection
+def language_codes(config):
+	if config.get('spider-settings', 'language') == "None":
+		language_ISOs = ""
+	else:
+		language = config.get('spider-settings', 'language')
+		ISO_codes = pd.read_csv(os.path.join(os.getcwd(), "misc", "ISO_language_codes.txt"), delimiter="\t", encoding="utf-8", on_bad_lines="skip")
+		language_ISOs = ISO_codes.loc[ISO_codes["language"] == language][["ISO1","ISO2","ISO3"]].iloc[0].tolist()
+		language_ISOs = "{},{},{}".format(language_ISOs[0], language_ISOs[1], language_ISOs[2])
+	return language_ISOs
+
+
+#returns the path of url chunk p
+def url_chunk_path(p):
+	return os.path.join(os.getcwd(), "chunks", "url_chunk_p" + str(p) + ".csv")
+
+
+#restores the output files of an interrupted crawl to their last checkpoint (see ARGUS/journal.py)
+#and returns the IDs of the finished websites and the number of the last url chunk
+def restore_outputs():
+	chunk_dir = os.path.join(os.getcwd(), "chunks")
+	files = os.listdir(chunk_dir)
+	journals = [os.path.join(chunk_dir, f) for f in files if f.split("_")[0] == "journal" and f.endswith(".tsv")]
+	outputs = [os.path.join(chunk_dir, f) for f in files if f.split("_")[0] in ("output", "website") and not f.endswith(".tmp")]
+	finished = journal.restore_outputs(journals, outputs, os.path.join(chunk_dir, "journal_restored.tsv"))
+	last_chunk = max([int(f.split("_p")[-1].split(".")[0]) for f in files if f.startswith("url_chunk_p")] + [0])
+	return finished, last_chunk
+
+
+#splits the URL file into url chunks and returns their numbers
+#resume: only the websites which were not finished by an interrupted crawl are split into new url chunks
+def write_url_chunks(config, resume=False):
+	#read URL file, only the ID and url columns are needed by the spiders
+	#the delimiter is given as typed in the GUI (e.g. "\t"), the fast C parser needs the actual character
+	ID, url_col = config.get('input-data', 'ID'), config.get('input-data', 'url')
+	delimiter = codecs.decode(config.get('input-data', 'delimiter'), "unicode_escape")
+	data = pd.read_csv(config.get('input-data', 'filepath'), delimiter=delimiter, encoding=config.get('input-data', 'encoding'),
+					   usecols=[ID, url_col], dtype={ID: str, url_col: str}, index_col=ID, on_bad_lines="skip", engine="c")
+
+	#new url chunks are numbered after the existing ones, so that the restored output files are kept
+	first_chunk = 1
+	if resume:
+		finished, last_chunk = restore_outputs()
+		data = data[~data.index.isin(list(finished))]
+		first_chunk = last_chunk + 1
+		print(len(finished), " websites were already finished, ", len(data), " websites are left.")
+		if len(data) == 0:
+			return []
+
+	#define number of url chunks to be created from URL file, smaller chunks are queued by scrapyd
+	#and keep all processes busy until the end
+	chunk_size = int(config.get('system', 'chunk_size', fallback="10000"))
+	n_url_chunks = chunking.n_chunks(len(data), chunk_size, int(config.get('system', 'n_cores')))
+
+	#balance chunks by the number of webpages of each website in a previous run
+	costs = None
+	if config.get('system', 'chunk_costs', fallback="") not in ("", "None"):
+		costs = chunking.read_site_costs(config.get('system', 'chunk_costs'))
+		print("Read the webpage counts of ", len(costs), " websites from a previous run.")
+
+	#generate url chunks
+	chunks = chunking.plan_chunks(data, n_url_chunks, costs)
+	for p, chunk in enumerate(chunks, first_chunk):
+		data.iloc[chunk].to_csv(url_chunk_path(p), sep="\t", encoding="utf-8")
+
+	print("Splitted your URLs into ", n_url_chunks, " parts.")
+	if costs is not None:
+		estimated = chunking.chunk_costs(data, chunks, costs)
+		print("Estimated webpages per part: ", int(min(estimated)), " to ", int(max(estimated)))
+	return list(range(first_chunk, first_chunk + n_url_chunks))
+
+
+#resume: continue an interrupted crawl, only websites which are not finished are scheduled again
+def start_crawl(resume=False):
 	#read config file
 	config = configparser.RawConfigParser()   
-	config.read(r".\bin\settings.txt")
+	config.read(os.path.join("bin", "settings.txt"))
 
 	#check path
 	error_message = """
@@ -31,45 +138,23 @@ def start_crawl():
 		print(error_message)
 		time.sleep(3)
 	else:
-		#read URL file
-		data = pd.read_csv(config.get('input-data', 'filepath'), delimiter=config.get('input-data', 'delimiter'), 
-						   encoding=config.get('input-data', 'encoding'), index_col=config.get('input-data', 'ID'), error_bad_lines=False, engine="python")
-
-		#get ISO codes for language detection
-		if config.get('spider-settings', 'language') == "None":
-			language_ISOs = ""
-		else:
-			language = config.get('spider-settings', 'language')
-			ISO_codes = pd.read_csv(os.getcwd() + "\\misc\\ISO_language_codes.txt", delimiter="\t", encoding="utf-8", error_bad_lines=False, engine="python")
-			language_ISOs = ISO_codes.loc[ISO_codes["language"] == language][["ISO1","ISO2","ISO3"]].iloc[0].tolist()
-			language_ISOs = "{},{},{}".format(language_ISOs[0], language_ISOs[1], language_ISOs[2])
-			
-		#define number of url chunks to be created from URL file
-		n_url_chunks = math.ceil(len(data)/10000)
-		if n_url_chunks < int(config.get('system', 'n_cores')):
-			n_url_chunks = int(config.get('system', 'n_cores'))
-
-		#generate url chunks
-		p = 1
-		for chunk in np.array_split(data, n_url_chunks):
-			chunk.to_csv(os.getcwd() +"\\chunks\\url_chunk_p" + str(p) + ".csv", sep="\t", encoding="utf-8")
-			p+=1
-			
-		print("Splitted your URLs into ", n_url_chunks, " parts.")
+		url_chunks = write_url_chunks(config, resume)
+		if len(url_chunks) == 0:
+			print("All websites are finished, nothing to resume.")
+			return
+		language_ISOs = language_codes(config)
 		time.sleep(3)
 
 		#schedule scrapyd jobs
-		for p in range(1, n_url_chunks+1):
-			url_chunk = os.getcwd() + "\\chunks\\url_chunk_p" + str(p) + ".csv"
-			#schedule textspider
-			if config.get('spider-settings', 'spider') == "text":
-				subprocess.run("curl http://localhost:6800/schedule.json -d project=ARGUS -d spider=textspider -d url_chunk={} -d limit={} -d ID={} -d url_col={} -d language={} -d setting=LOG_LEVEL={} -d prefer_short_urls={}"
-						   .format(url_chunk, config.get('spider-settings', 'limit'), config.get('input-data', 'ID'), config.get('input-data', 'url'), language_ISOs, config.get('spider-settings', 'log_level'), config.get('spider-settings', 'prefer_short_urls')))
-			#schedule linkspider
-			elif config.get('spider-settings', 'spider') == "link":
-				subprocess.run("curl http://localhost:6800/schedule.json -d project=ARGUS -d spider=linkspider -d url_chunk={} -d limit={} -d ID={} -d url_col={} -d language={} -d setting=LOG_LEVEL={} -d prefer_short_urls={}"
-						   .format(url_chunk, config.get('spider-settings', 'limit'), config.get('input-data', 'ID'), config.get('input-data', 'url'), language_ISOs, config.get('spider-settings', 'log_level'), config.get('spider-settings', 'prefer_short_urls')))
-
-		print("Scheduled ", n_url_chunks, " spiders to scrape your URLs.\nOpening web interface...")
+		spider = spider_name(config)
+		arguments = spider_arguments(config, language_ISOs)
+		settings = spider_settings(config)
+		jobs = []
+		for p in url_chunks:
+			jobs.append((spider, dict(arguments, url_chunk=url_chunk_path(p)), settings))
+		with ScrapydClient() as client:
+			client.schedule_many(jobs)
+
+		print("Scheduled ", len(url_chunks), " spiders to scrape your URLs.\nOpening web interface...")
 		time.sleep(3)
 		webbrowser.open("http://127.0.0.1:6800/", new=0, autoraise=True)
\ No newline at end of file
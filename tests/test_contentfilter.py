@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of ArgusContentFilterMiddleware: the headers_received signal handler
+stops the body download, process_response only rejects 2xx responses.
+"""
+
+import pytest
+from scrapy.exceptions import IgnoreRequest, StopDownload
+from scrapy.http import Headers, Request, Response
+from scrapy.spiders import Spider
+from scrapy.utils.test import get_crawler
+
+from ARGUS.middlewares import ArgusContentFilterMiddleware
+
+
+def make_middleware():
+    crawler = get_crawler(Spider, {"ACCEPTED_CONTENT_TYPES": ["text/html", "application/xhtml+xml"], "DOWNLOAD_MAXSIZE": 1000})
+    return ArgusContentFilterMiddleware.from_crawler(crawler), Spider("test")
+
+
+#sends the headers to the signal handler like the download handler and returns the response that reaches process_response
+def download(middleware, spider, request, status, headers, body_length=9):
+    headers = Headers(headers)
+    body = b"x" * body_length
+    try:
+        middleware.headers_received(headers, body_length, request, spider)
+    except StopDownload as stop:
+        assert not stop.fail
+        body = b""
+    return middleware.process_response(request, Response(request.url, status=status, headers=headers, body=body), spider)
+
+
+def test_redirect_with_text_plain_is_followed():
+    middleware, spider = make_middleware()
+    request = Request("http://www.example.com/")
+    response = download(middleware, spider, request, 301, {"Content-Type": "text/plain", "Location": "http://example.com/"})
+    assert response.status == 301
+    assert response.headers["Location"] == b"http://example.com/"
+    assert "rejected" not in request.meta
+
+
+def test_error_page_with_text_plain_keeps_its_status():
+    middleware, spider = make_middleware()
+    request = Request("http://www.example.com/")
+    response = download(middleware, spider, request, 404, {"Content-Type": "text/plain"})
+    assert response.status == 404
+    assert "rejected" not in request.meta
+
+
+def test_non_html_page_is_rejected():
+    middleware, spider = make_middleware()
+    request = Request("http://www.example.com/report")
+    with pytest.raises(IgnoreRequest):
+        download(middleware, spider, request, 200, {"Content-Type": "application/pdf"}, 500)
+    assert request.meta["rejected"] == "Content-Type"
+    assert middleware.stats.get_value("contentfilter/bytes_saved") == 500
+
+
+def test_oversized_page_is_rejected():
+    middleware, spider = make_middleware()
+    request = Request("http://www.example.com/")
+    with pytest.raises(IgnoreRequest):
+        download(middleware, spider, request, 200, {"Content-Type": "text/html; charset=utf-8"}, 5000)
+    assert request.meta["rejected"] == "Size"
+
+
+def test_html_page_passes():
+    middleware, spider = make_middleware()
+    request = Request("http://www.example.com/")
+    response = download(middleware, spider, request, 200, {"Content-Type": "text/html; charset=utf-8"})
+    assert response.body == b"x" * 9
+    assert "rejected" not in request.meta
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of BatchCsvItemExporter: rows of an unfinished batch reach the file
+once flush_interval has passed.
+"""
+
+import time
+
+from ARGUS.compression import open_compressed
+from ARGUS.exporters import BatchCsvItemExporter
+
+
+def test_rows_are_flushed_after_flush_interval(tmp_path):
+    fn = str(tmp_path / "output_1.csv")
+    f = open_compressed(fn)
+    exporter = BatchCsvItemExporter(f, ["ID", "text"], flush_interval=0.01)
+    exporter.export_row(["1", "page 1"])
+    exporter.export_row(["2", "page 2"])
+    time.sleep(0.02)
+    exporter.export_row(["3", "page 3"])
+    #readable while the file is still open
+    with open(fn, "rb") as output:
+        assert output.read() == b"ID\ttext\r\n1\tpage 1\r\n2\tpage 2\r\n3\tpage 3\r\n"
+    f.close()
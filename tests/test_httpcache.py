@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of LRUFilesystemCacheStorage: the least recently used entries are
+evicted, and the size index is shared between jobs so that a job does not
+scan the cache again.
+"""
+
+from scrapy.http import HtmlResponse, Request
+from scrapy.spiders import Spider
+from scrapy.utils.test import get_crawler
+
+from ARGUS.httpcache import LRUFilesystemCacheStorage
+
+
+def open_storage(tmp_path, max_size):
+    crawler = get_crawler(Spider, {"HTTPCACHE_DIR": str(tmp_path), "HTTPCACHE_MAX_SIZE": max_size, "HTTPCACHE_GZIP": False})
+    spider = Spider("textspider")
+    spider.crawler = crawler
+    storage = LRUFilesystemCacheStorage(crawler.settings)
+    storage.open_spider(spider)
+    return storage, spider
+
+
+def store(storage, spider, url):
+    request = Request(url)
+    storage.store_response(spider, request, HtmlResponse(url, body=b"x" * 1000, request=request))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    storage, spider = open_storage(tmp_path, 0)
+    for page in ("a", "b", "c"):
+        store(storage, spider, "http://www.a.com/" + page)
+    entry = storage.total_size() // 3
+    storage.retrieve_response(spider, Request("http://www.a.com/a"))
+    storage.close_spider(spider)
+
+    storage, spider = open_storage(tmp_path, 3 * entry)
+    store(storage, spider, "http://www.a.com/d")
+    #b was used least recently
+    assert storage.retrieve_response(spider, Request("http://www.a.com/b")) is None
+    for page in ("a", "c", "d"):
+        assert storage.retrieve_response(spider, Request("http://www.a.com/" + page)) is not None
+    assert storage.total_size() <= storage.max_size
+    assert storage.total_size() == storage.index.execute("SELECT SUM(size) FROM entries").fetchone()[0]
+    assert storage.evicted == 1
+    storage.close_spider(spider)
+
+
+def test_cache_is_only_scanned_once(tmp_path, monkeypatch):
+    storage, spider = open_storage(tmp_path, 0)
+    store(storage, spider, "http://www.a.com/")
+    size = storage.total_size()
+    storage.close_spider(spider)
+
+    def scan(self):
+        raise AssertionError("the cache was scanned again")
+    monkeypatch.setattr(LRUFilesystemCacheStorage, "scan", scan)
+    storage, spider = open_storage(tmp_path, 0)
+    assert storage.total_size() == size
+    storage.close_spider(spider)
+    #without the index the cache is scanned
+    monkeypatch.undo()
+    (tmp_path / "textspider" / "index.sqlite").unlink()
+    for fn in ("index.sqlite-wal", "index.sqlite-shm"):
+        if (tmp_path / "textspider" / fn).exists():
+            (tmp_path / "textspider" / fn).unlink()
+    storage, spider = open_storage(tmp_path, 0)
+    assert storage.total_size() == size
+    storage.close_spider(spider)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the completion journal: read_journal ignores a torn last group and
+restore_outputs restores the output files of an interrupted crawl to their
+last checkpoint.
+"""
+
+import csv
+import io
+import os
+
+import pytest
+
+from ARGUS.compression import COMPRESSION_EXTENSIONS, open_compressed, open_output_file, zstandard
+from ARGUS.journal import CompletionJournal, read_journal, restore_outputs
+
+
+#returns the rows as they are written by the csv exporter
+def csv_bytes(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter="\t")
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def read_rows(fn):
+    with open_output_file(fn, newline="") as f:
+        return list(csv.reader(f, delimiter="\t"))
+
+
+def test_torn_last_group_is_ignored(tmp_path):
+    fn = str(tmp_path / "journal_1.tsv")
+    journal = CompletionJournal(fn)
+    journal.finished("1", "a.com")
+    journal.checkpoint([(str(tmp_path / "output_1.csv"), 100)], ["2"])
+    journal.close()
+    with open(fn, "a", encoding="utf-8", newline="\n") as f:
+        #a complete group without its checkpoint line and a line cut off by the crash
+        f.write("finished\t2\tb.com\ncheckpoint\toutput_1.csv=2")
+    finished, sizes, open_IDs = read_journal(fn)
+    assert finished == {"1": "a.com"}
+    assert sizes == {"output_1.csv": 100}
+    assert open_IDs == {"output_1.csv": {"2"}}
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", pytest.param("zstd", marks=pytest.mark.skipif(zstandard is None, reason="zstandard is not installed"))])
+def test_outputs_are_restored_to_their_checkpoint(tmp_path, compression):
+    chunk_dir = tmp_path
+    output = str(chunk_dir / ("output_1.csv" + COMPRESSION_EXTENSIONS[compression]))
+    unchecked = str(chunk_dir / ("output_2.csv" + COMPRESSION_EXTENSIONS[compression]))
+    journal_fn = str(chunk_dir / "journal_1.tsv")
+
+    #website 1 is finished, the pages of the streamed website 2 are already in the output at the checkpoint
+    f = open_compressed(output, compression)
+    f.write(csv_bytes([["1", "page 1"], ["2", "page 2a"]]))
+    #the pipelines end the compressed stream at a checkpoint, so that the file can be truncated there
+    f.close()
+    journal = CompletionJournal(journal_fn)
+    journal.finished("1", "a.com")
+    journal.checkpoint([(output, os.path.getsize(output))], ["2"])
+    journal.close()
+    #written after the checkpoint, lost with the crash
+    f = open_compressed(output, compression)
+    f.write(csv_bytes([["2", "page 2b"], ["3", "page 3"]]))
+    f.close()
+    #the output of a job which crashed before its first checkpoint
+    f = open_compressed(unchecked, compression)
+    f.write(csv_bytes([["4", "page 4"]]))
+    f.close()
+
+    restored = str(chunk_dir / "journal_restored.tsv")
+    finished = restore_outputs([journal_fn], [output, unchecked], restored)
+    assert finished == {"1": "a.com"}
+    assert read_rows(output) == [["1", "page 1"]]
+    assert not os.path.exists(unchecked)
+    assert not os.path.exists(journal_fn)
+    #the restored journal records the restored state, so the crawl can be resumed again
+    finished, sizes, open_IDs = read_journal(restored)
+    assert finished == {"1": "a.com"}
+    assert sizes == {os.path.basename(output): os.path.getsize(output)}
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of ScrapydClient against a fake scrapyd which resets the connection
+after it queued a job: the job must not be scheduled a second time.
+"""
+
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from bin.scrapyd_client import ScrapydClient
+
+
+@pytest.fixture
+def scrapyd():
+    state = {"jobs": [], "resets": 1}
+
+    class FakeScrapyd(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            query = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+            state["jobs"].append(query["jobid"][0])
+            if state["resets"]:
+                #the job is queued, but the answer is lost
+                state["resets"] -= 1
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b"\1\0\0\0\0\0\0\0")
+                self.close_connection = True
+                self.connection.close()
+                return
+            self.reply({"status": "ok", "jobid": query["jobid"][0]})
+
+        def do_GET(self):
+            self.reply({"status": "ok", "pending": [{"id": job, "spider": "textspider"} for job in state["jobs"]], "running": [], "finished": []})
+
+        def reply(self, result):
+            body = json.dumps(result).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeScrapyd)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1], state
+    server.shutdown()
+
+
+def test_schedule_is_not_repeated_after_a_reset(scrapyd):
+    port, state = scrapyd
+    with ScrapydClient(port=port) as client:
+        jobs = client.schedule_many([("textspider", {"url_chunk": "url_p1.csv"}, {}), ("textspider", {"url_chunk": "url_p2.csv"}, {})])
+    assert jobs == state["jobs"]
+    assert len(set(state["jobs"])) == 2
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the subpage bookkeeping of the spiders: unparseable urls are dropped
+from the url stack and a subpage counts once even if processURLstack runs again
+for it (fallback in parse_subpage).
+"""
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+from scrapy.loader import ItemLoader
+
+from ARGUS.frontier import URLFrontier
+from ARGUS.items import Collector, LinkCollector
+from ARGUS.spiders.linkspider import LinkspiderSpider
+from ARGUS.spiders.textspider import TextspiderSpider
+
+BAD_URLS = ["http://www.a.com:abc/", "http://[abc/"]
+
+
+def make_spider(spidercls, tmp_path, per_site_parallelism):
+    url_chunk = tmp_path / "url_p1.csv"
+    url_chunk.write_text("ID\turl\n1\twww.a.com\n", encoding="utf-8")
+    spider = spidercls(url_chunk=str(url_chunk), limit=10, per_site_parallelism=per_site_parallelism)
+    #added by parse when the start page was downloaded
+    spider.allowed_domains.add("www.a.com")
+    return spider
+
+
+#returns the response of a subpage request of a website with the given urls on its stack and one page in flight
+def subpage_response(spidercls, urls):
+    loader = ItemLoader(item=Collector() if spidercls is TextspiderSpider else LinkCollector())
+    loader.add_value("ID", "1")
+    loader.add_value("scrape_counter", 1)
+    urlstack = URLFrontier()
+    urlstack.extend(urls)
+    urlstack.in_flight = 1
+    meta = {"loader": loader, "urlstack": urlstack, "fingerprints": set(), "links": {}, "subpage": True}
+    request = Request("http://www.a.com/page", meta=meta)
+    return HtmlResponse(request.url, body=b"<html></html>", request=request)
+
+
+@pytest.mark.parametrize("spidercls", [TextspiderSpider, LinkspiderSpider])
+def test_unparseable_urls_are_dropped(spidercls, tmp_path):
+    spider = make_spider(spidercls, tmp_path, 2)
+    response = subpage_response(spidercls, BAD_URLS + ["http://www.a.com/about"])
+    output = spider.processURLstack(response)
+    requests = [x for x in output if isinstance(x, Request)]
+    assert [request.url for request in requests] == ["http://www.a.com/about"]
+    assert response.meta["urlstack"].in_flight == 1
+    assert len(response.meta["urlstack"]) == 0
+
+
+@pytest.mark.parametrize("spidercls", [TextspiderSpider, LinkspiderSpider])
+def test_subpage_is_counted_once(spidercls, tmp_path):
+    spider = make_spider(spidercls, tmp_path, 1)
+    response = subpage_response(spidercls, ["http://www.a.com/about"])
+    urlstack = response.meta["urlstack"]
+    spider.processURLstack(response)
+    assert urlstack.in_flight == 1
+    #the fallback of parse_subpage runs processURLstack again for the same response
+    output = spider.processURLstack(response)
+    assert urlstack.in_flight == 1
+    assert not any(isinstance(x, Request) for x in output)